@@ -0,0 +1,74 @@
+"""
+Compare two sets of results from `benchmarks/micro.py`.
+
+Run with `uv run python benchmarks/compare.py BASELINE CANDIDATE`.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="compare",
+        description="Compare two sets of microbenchmark results.",
+    )
+    parser.add_argument("baseline", type=Path, help="the results to compare against")
+    parser.add_argument("candidate", type=Path, help="the results to compare")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=5.0,
+        help="the percentage change in ops/sec below which results are considered unchanged (default: 5)",
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="exit with a non-zero status if any benchmark got slower",
+    )
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())
+    candidate = json.loads(args.candidate.read_text())
+
+    print(
+        f"baseline:  {baseline['metadata'].get('commit')} ({args.baseline})\n"
+        f"candidate: {candidate['metadata'].get('commit')} ({args.candidate})\n"
+    )
+    print(
+        f"{'benchmark':<40} {'baseline':>12} {'candidate':>12} {'change':>8} {'peak memory':>12}"
+    )
+
+    regressed = False
+
+    for name, result in candidate["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:<40} {'-':>12} {result['ops_per_sec']:>12,.0f}")
+            continue
+
+        old = baseline["results"][name]
+        change = (result["ops_per_sec"] / old["ops_per_sec"] - 1) * 100
+        memory_change = result["peak_bytes"] - old["peak_bytes"]
+
+        if change >= args.threshold:
+            verdict = "faster"
+        elif change <= -args.threshold:
+            verdict = "slower"
+            regressed = True
+        else:
+            verdict = ""
+
+        print(
+            f"{name:<40} {old['ops_per_sec']:>12,.0f} {result['ops_per_sec']:>12,.0f} {change:>+7.1f}%"
+            f" {memory_change:>+11,}B {verdict}"
+        )
+
+    if regressed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
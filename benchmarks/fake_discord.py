@@ -0,0 +1,309 @@
+"""
+A local stand-in for the parts of Discord that Snowflake talks to, for load testing.
+
+Run with `uv run python benchmarks/fake_discord.py`, then start Snowflake with
+`SNOWFLAKE_PRIVATE__DISCORD_URL` set to the stand-in's URL (http://127.0.0.1:8001 by default).
+
+The stand-in keeps no state between requests: authorization codes and tokens encode the user and scopes they were
+issued for. Its `/oauth2/authorize` endpoint approves every request immediately.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import secrets
+import time
+import typing as t
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Form, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, RedirectResponse
+from starlette.datastructures import URL
+
+
+@dataclass
+class FakeDiscordConfig:
+    url: str = "http://127.0.0.1:8001"
+    latency: float = 0.05
+    jitter: float = 0.01
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 0.1
+    bucket_limit: int = 50
+    bucket_window: float = 1.0
+    users: int = 1000
+    guilds: int = 10
+
+
+config = FakeDiscordConfig()
+app = FastAPI(title="Fake Discord", docs_url=None, redoc_url=None, openapi_url=None)
+
+_buckets: dict[tuple[str, str], tuple[float, int]] = {}
+
+
+def encode_grant(user_id: int, scope: str) -> str:
+    """
+    Create an authorization code or token for a user and a set of scopes.
+    """
+    encoded_scope = base64.urlsafe_b64encode(scope.encode()).decode().rstrip("=")
+    return f"{user_id}.{encoded_scope}.{secrets.token_urlsafe(16)}"
+
+
+def decode_grant(grant: str) -> tuple[int, str]:
+    """
+    Return the user ID and scopes an authorization code or token was issued for.
+    """
+    try:
+        user_id, encoded_scope, _ = grant.split(".")
+        scope = base64.urlsafe_b64decode(
+            encoded_scope + "=" * (-len(encoded_scope) % 4)
+        )
+        return int(user_id), scope.decode()
+    except ValueError:
+        raise HTTPException(401, {"message": "401: Unauthorized", "code": 0})
+
+
+def get_user_id(authorization: str | None) -> int:
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(401, {"message": "401: Unauthorized", "code": 0})
+
+    return decode_grant(authorization.removeprefix("Bearer "))[0]
+
+
+@app.middleware("http")
+async def simulate_discord(request: Request, call_next):
+    """
+    Add latency, errors, and rate limits to responses.
+    """
+    await asyncio.sleep(max(0.0, random.gauss(config.latency, config.jitter)))
+
+    if request.url.path.startswith("/oauth2/") or request.url.path.startswith(
+        "/.well-known/"
+    ):
+        return await call_next(request)
+
+    if random.random() < config.error_rate:
+        return JSONResponse(
+            {"message": "500: Internal Server Error", "code": 0}, status_code=500
+        )
+
+    route = f"{request.method} {request.url.path}"
+    identity = hashlib.sha256(
+        request.headers.get("authorization", "").encode()
+    ).hexdigest()
+
+    now = time.monotonic()
+    window_start, count = _buckets.get((route, identity), (now, 0))
+
+    if now - window_start >= config.bucket_window:
+        window_start, count = now, 0
+
+    reset_after = config.bucket_window - (now - window_start)
+
+    if count >= config.bucket_limit or random.random() < config.rate_limit_rate:
+        retry_after = max(reset_after, config.retry_after)
+
+        return JSONResponse(
+            {
+                "message": "You are being rate limited.",
+                "retry_after": retry_after,
+                "global": False,
+            },
+            status_code=429,
+            headers={
+                "Retry-After": str(int(retry_after) + 1),
+                "X-RateLimit-Scope": "user",
+            },
+        )
+
+    _buckets[route, identity] = window_start, count + 1
+
+    if len(_buckets) > 100000:
+        for key, (start, _) in list(_buckets.items()):
+            if now - start >= config.bucket_window:
+                del _buckets[key]
+
+    response = await call_next(request)
+    response.headers.update(
+        {
+            "X-RateLimit-Bucket": hashlib.sha256(route.encode()).hexdigest()[:16],
+            "X-RateLimit-Limit": str(config.bucket_limit),
+            "X-RateLimit-Remaining": str(config.bucket_limit - count - 1),
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+        }
+    )
+
+    return response
+
+
+@app.get("/.well-known/openid-configuration")
+async def discovery():
+    return {
+        "issuer": config.url,
+        "authorization_endpoint": f"{config.url}/oauth2/authorize",
+        "token_endpoint": f"{config.url}/api/oauth2/token",
+        "userinfo_endpoint": f"{config.url}/api/oauth2/userinfo",
+        "jwks_uri": f"{config.url}/api/oauth2/keys",
+        "response_types_supported": ["code", "token"],
+        "subject_types_supported": ["public"],
+        "id_token_signing_alg_values_supported": ["RS256"],
+        "scopes_supported": ["openid", "identify", "email", "guilds"],
+    }
+
+
+@app.get("/oauth2/authorize")
+async def authorize(redirect_uri: str, scope: str, state: str | None = None):
+    code = encode_grant(random.randrange(config.users), scope)
+    url = URL(redirect_uri).include_query_params(code=code)
+
+    if state:
+        url = url.include_query_params(state=state)
+
+    return RedirectResponse(str(url), status_code=302)
+
+
+@app.post("/api/oauth2/token")
+async def token(
+    grant_type: t.Annotated[str, Form()],
+    code: t.Annotated[str, Form()] = None,
+    refresh_token: t.Annotated[str, Form()] = None,
+):
+    match grant_type:
+        case "authorization_code" if code:
+            user_id, scope = decode_grant(code)
+        case "refresh_token" if refresh_token:
+            user_id, scope = decode_grant(refresh_token)
+        case _:
+            return JSONResponse({"error": "invalid_grant"}, status_code=400)
+
+    return {
+        "access_token": encode_grant(user_id, scope),
+        "token_type": "Bearer",
+        "expires_in": 604800,
+        "refresh_token": encode_grant(user_id, scope),
+        "scope": scope,
+    }
+
+
+@app.get("/api/oauth2/userinfo")
+async def userinfo(authorization: t.Annotated[str, Header()] = None):
+    user_id = get_user_id(authorization)
+
+    return {
+        "sub": str(user_id),
+        "preferred_username": f"user{user_id}",
+        "nickname": f"User {user_id}",
+        "picture": f"https://cdn.discordapp.com/avatars/{user_id}/avatar.png",
+        "locale": "en-US",
+        "email": f"user{user_id}@example.com",
+        "email_verified": True,
+    }
+
+
+@app.get("/api/users/@me")
+async def me(authorization: t.Annotated[str, Header()] = None):
+    user_id = get_user_id(authorization)
+
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "global_name": f"User {user_id}",
+        "avatar": "avatar",
+        "locale": "en-US",
+        "email": f"user{user_id}@example.com",
+        "verified": True,
+    }
+
+
+@app.get("/api/users/@me/guilds")
+async def guilds(authorization: t.Annotated[str, Header()] = None):
+    user_id = get_user_id(authorization)
+
+    return [
+        {"id": str(user_id * config.guilds + i), "name": f"Guild {i}"}
+        for i in range(config.guilds)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="fake_discord",
+        description="Run a local stand-in for Discord's OAuth2 and user APIs.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=config.latency * 1000,
+        help="the mean latency of responses in milliseconds (default: 50)",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=config.jitter * 1000,
+        help="the standard deviation of the latency of responses in milliseconds (default: 10)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=config.error_rate,
+        help="the fraction of API requests that fail with HTTP 500 (default: 0)",
+    )
+    parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=config.rate_limit_rate,
+        help="the fraction of API requests that are rate limited regardless of their bucket (default: 0)",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=config.retry_after,
+        help="the minimum retry_after of rate limited requests in seconds (default: 0.1)",
+    )
+    parser.add_argument(
+        "--bucket-limit",
+        type=int,
+        default=config.bucket_limit,
+        help="the number of requests allowed per route and token in each rate limit window (default: 50)",
+    )
+    parser.add_argument(
+        "--bucket-window",
+        type=float,
+        default=config.bucket_window,
+        help="the length of each rate limit window in seconds (default: 1)",
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=config.users,
+        help="the number of distinct users to authorize (default: 1000)",
+    )
+    parser.add_argument(
+        "--guilds",
+        type=int,
+        default=config.guilds,
+        help="the number of guilds each user is a member of (default: 10)",
+    )
+    args = parser.parse_args()
+
+    config.url = f"http://{args.host}:{args.port}"
+    config.latency = args.latency / 1000
+    config.jitter = args.jitter / 1000
+    config.error_rate = args.error_rate
+    config.rate_limit_rate = args.rate_limit_rate
+    config.retry_after = args.retry_after
+    config.bucket_limit = args.bucket_limit
+    config.bucket_window = args.bucket_window
+    config.users = args.users
+    config.guilds = args.guilds
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
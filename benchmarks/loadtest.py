@@ -0,0 +1,280 @@
+"""
+Drive Snowflake's full login flow at high concurrency and report throughput and latency per endpoint.
+
+Run with `uv run python benchmarks/loadtest.py`. Snowflake should be pointed at `benchmarks/fake_discord.py` (see
+the README in this directory) unless you really mean to load test Discord.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import httpx
+
+CALLBACK_URL = "https://app.example.com/callback"
+
+
+class Recorder:
+    """
+    Collects the latency and status of every request made during a load test.
+    """
+
+    def __init__(self):
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.statuses: defaultdict[str, Counter[int]] = defaultdict(Counter)
+        self.flows = 0
+        self.failed_flows = 0
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        name: str,
+        method: str,
+        url: str,
+        expected_status: int,
+        **kwargs,
+    ) -> httpx.Response:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[name].append(time.perf_counter() - start)
+        self.statuses[name][response.status_code] += 1
+
+        if response.status_code != expected_status:
+            raise httpx.HTTPStatusError(
+                f"{name} returned HTTP {response.status_code}: {response.text[:200]}",
+                request=response.request,
+                response=response,
+            )
+
+        return response
+
+    def report(self, duration: float) -> dict:
+        endpoints = {}
+
+        for name, latencies in self.latencies.items():
+            percentiles = (
+                statistics.quantiles(latencies, n=100, method="inclusive")
+                if len(latencies) > 1
+                else latencies * 99
+            )
+
+            endpoints[name] = {
+                "requests": len(latencies),
+                "requests_per_sec": len(latencies) / duration,
+                "p50_ms": percentiles[49] * 1000,
+                "p95_ms": percentiles[94] * 1000,
+                "p99_ms": percentiles[98] * 1000,
+                "max_ms": max(latencies) * 1000,
+                "statuses": {
+                    str(status): count for status, count in self.statuses[name].items()
+                },
+            }
+
+        return {
+            "duration": duration,
+            "flows": self.flows,
+            "failed_flows": self.failed_flows,
+            "flows_per_sec": self.flows / duration,
+            "endpoints": endpoints,
+        }
+
+
+async def run_flow(
+    client: httpx.AsyncClient, recorder: Recorder, args: argparse.Namespace
+) -> None:
+    """
+    Log in once, then exchange the resulting tokens as configured.
+    """
+    redirect_uri = f"{args.url.rstrip('/')}/r/{CALLBACK_URL}"
+
+    response = await recorder.request(
+        client,
+        "GET /authorize",
+        "GET",
+        "/authorize",
+        302,
+        params={
+            "client_id": args.client_id,
+            "scope": args.scope,
+            "redirect_uri": redirect_uri,
+            "state": "loadtest",
+            "nonce": "loadtest",
+        },
+    )
+
+    # The stand-in for Discord approves the authorization immediately and redirects back to Snowflake.
+    response = await recorder.request(
+        client, "GET discord/authorize", "GET", response.headers["location"], 302
+    )
+
+    response = await recorder.request(
+        client, "GET /r/{redirect_uri}", "GET", response.headers["location"], 302
+    )
+
+    query = dict(
+        urllib.parse.parse_qsl(
+            urllib.parse.urlsplit(response.headers["location"]).query
+        )
+    )
+
+    response = await recorder.request(
+        client,
+        "POST /token",
+        "POST",
+        "/token",
+        200,
+        data={
+            "grant_type": "authorization_code",
+            "code": query["code"],
+            "redirect_uri": redirect_uri,
+            "client_id": args.client_id,
+            "client_secret": args.client_secret,
+        },
+    )
+    tokens = response.json()
+
+    for _ in range(args.userinfo_calls):
+        await recorder.request(
+            client,
+            "GET /userinfo",
+            "GET",
+            "/userinfo",
+            200,
+            headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        )
+
+    for _ in range(args.refreshes):
+        response = await recorder.request(
+            client,
+            "POST /token (refresh)",
+            "POST",
+            "/token",
+            200,
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": tokens["refresh_token"],
+                "client_id": args.client_id,
+                "client_secret": args.client_secret,
+            },
+        )
+        tokens = response.json()
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    args: argparse.Namespace,
+    deadline: float,
+) -> None:
+    while time.monotonic() < deadline:
+        try:
+            await run_flow(client, recorder, args)
+            recorder.flows += 1
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            recorder.failed_flows += 1
+
+            if args.verbose:
+                print(f"Flow failed: {e!r}")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    recorder = Recorder()
+
+    async with httpx.AsyncClient(
+        base_url=args.url,
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=args.concurrency),
+    ) as client:
+        start = time.monotonic()
+        deadline = start + args.duration
+
+        await asyncio.gather(
+            *(worker(client, recorder, args, deadline) for _ in range(args.concurrency))
+        )
+
+        return recorder.report(time.monotonic() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="loadtest",
+        description="Drive Snowflake's login flow at high concurrency.",
+    )
+    parser.add_argument(
+        "--url",
+        default="http://localhost:8000",
+        help="Snowflake's URL (default: http://localhost:8000)",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=50,
+        help="the number of flows to run at once (default: 50)",
+    )
+    parser.add_argument(
+        "-d",
+        "--duration",
+        type=float,
+        default=30,
+        help="how long to run for in seconds (default: 30)",
+    )
+    parser.add_argument("--client-id", default="loadtest")
+    parser.add_argument("--client-secret", default="loadtest")
+    parser.add_argument("--scope", default="openid profile email groups")
+    parser.add_argument(
+        "--userinfo-calls",
+        type=int,
+        default=1,
+        help="the number of /userinfo requests made with each access token (default: 1)",
+    )
+    parser.add_argument(
+        "--refreshes",
+        type=int,
+        default=0,
+        help="the number of refresh_token grants made after each login (default: 0)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="the timeout for each request in seconds (default: 30)",
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, help="write the results as JSON to this file"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="print every failed flow"
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(
+        f"{results['flows']} flows ({results['failed_flows']} failed) in {results['duration']:.1f}s: "
+        f"{results['flows_per_sec']:,.1f} flows/s\n"
+    )
+    print(
+        f"{'endpoint':<24} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses"
+    )
+
+    for name, endpoint in results["endpoints"].items():
+        statuses = ", ".join(
+            f"{status}: {count}" for status, count in endpoint["statuses"].items()
+        )
+        print(
+            f"{name:<24} {endpoint['requests']:>9} {endpoint['requests_per_sec']:>9,.1f}"
+            f" {endpoint['p50_ms']:>8.1f} {endpoint['p95_ms']:>8.1f} {endpoint['p99_ms']:>8.1f}  {statuses}"
+        )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
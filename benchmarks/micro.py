@@ -0,0 +1,272 @@
+"""
+Microbenchmarks for the functions on Snowflake's login path.
+
+Run with `uv run python benchmarks/micro.py`. Settings are read from `SNOWFLAKE_*` environment variables as usual,
+except that a throwaway private key for `SNOWFLAKE_SIGNING_ALGORITHM` is used unless `SNOWFLAKE_PRIVATE_KEY` is set.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import typing as t
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from snowflake import keys  # noqa: E402
+
+if not os.getenv("SNOWFLAKE_PRIVATE_KEY"):
+    os.environ["SNOWFLAKE_PRIVATE_KEY"] = json.dumps(
+        keys.generate_key(os.getenv("SNOWFLAKE_SIGNING_ALGORITHM", "RS256")).as_dict(
+            private=True
+        )
+    )
+
+from fastapi import Request  # noqa: E402
+
+from snowflake import security, utils  # noqa: E402
+from snowflake.app import app  # noqa: E402
+from snowflake.serializable import (  # noqa: E402
+    SnowflakeAuthorizationData,
+    SnowflakeStateData,
+)
+from snowflake.settings import settings  # noqa: E402
+
+
+def make_request(path: str = "/token") -> Request:
+    """
+    Build a request to Snowflake without going through the ASGI stack.
+    """
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "scheme": "https",
+            "server": ("snowflake.example.com", 443),
+            "path": path,
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"snowflake.example.com")],
+            "app": app,
+            "router": app.router,
+        }
+    )
+
+
+def get_benchmarks() -> dict[str, t.Callable[[], t.Any]]:
+    """
+    Return the benchmarks to run, keyed by name.
+    """
+    request = make_request()
+    oidc_metadata = utils.get_discovery_info(request)
+
+    claims = {
+        "sub": "1234567890",
+        "name": "Kumiko",
+        "preferred_username": "kumiko",
+        "locale": "en-US",
+        "picture": "https://cdn.discordapp.com/avatars/1234567890/abcdef.png",
+        "email": "kumiko@kitauji.ed.jp",
+        "email_verified": True,
+        "groups": [str(i) for i in range(20)],
+        "iss": oidc_metadata["issuer"],
+        "aud": oidc_metadata["userinfo_endpoint"],
+        "iat": int(time.time()),
+        "exp": int(time.time()) + 3600,
+    }
+    token = security.create_jwt(claims)
+
+    state_data = SnowflakeStateData(
+        state="state",
+        redirect_uri=utils.fix_redirect_uri(request, "https://app.example.com/cb"),
+        nonce="nonce",
+        referrer="https://app.example.com/",
+    )
+    state_token = state_data.to_jwt()
+
+    authorization_data = SnowflakeAuthorizationData(code="code", nonce="nonce")
+    authorization_token = authorization_data.to_jwt()
+
+    return {
+        "security.create_jwt": lambda: security.create_jwt(claims),
+        "security.decode_jwt": lambda: security.decode_jwt(
+            token,
+            iss={"essential": True, "value": oidc_metadata["issuer"]},
+            aud={"essential": True, "value": oidc_metadata["userinfo_endpoint"]},
+        ),
+        "security.get_jwks": security.get_jwks,
+        "SnowflakeStateData.to_jwt": state_data.to_jwt,
+        "SnowflakeStateData.from_jwt": lambda: SnowflakeStateData.from_jwt(state_token),
+        "SnowflakeAuthorizationData.to_jwt": authorization_data.to_jwt,
+        "SnowflakeAuthorizationData.from_jwt": lambda: SnowflakeAuthorizationData.from_jwt(
+            authorization_token
+        ),
+        "utils.convert_scopes": lambda: utils.convert_scopes(
+            "openid profile email groups", to_format="discord", output_type=str
+        ),
+        "utils.get_discovery_info": lambda: utils.get_discovery_info(request),
+        "utils.fix_redirect_uri": lambda: utils.fix_redirect_uri(
+            request, "https://app.example.com/cb"
+        ),
+    }
+
+
+def measure_time(
+    function: t.Callable[[], t.Any], *, min_time: float, rounds: int
+) -> list[float]:
+    """
+    Return the operations per second achieved by `function` in each of several rounds.
+    """
+    # Calibrate the number of calls per round so that each round takes at least `min_time` seconds.
+    number = 1
+
+    while True:
+        start = time.perf_counter()
+
+        for _ in range(number):
+            function()
+
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= min_time:
+            break
+
+        number *= 2 if elapsed < min_time / 10 else int(min_time / elapsed) + 1
+
+    results = []
+
+    for _ in range(rounds):
+        start = time.perf_counter()
+
+        for _ in range(number):
+            function()
+
+        results.append(number / (time.perf_counter() - start))
+
+    return results
+
+
+def measure_memory(function: t.Callable[[], t.Any], *, calls: int) -> dict[str, int]:
+    """
+    Return the peak memory allocated during a call to `function` and the memory retained per call.
+    """
+    tracemalloc.start()
+
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        peaks = []
+
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            function()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "peak_bytes": int(statistics.median(peaks)),
+        "retained_bytes": max(0, (end - start) // calls),
+    }
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="micro",
+        description="Benchmark the functions on Snowflake's login path.",
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, help="write the results as JSON to this file"
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        default="",
+        help="only run benchmarks whose names contain this string",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="the minimum duration of each round in seconds (default: 0.2)",
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=5,
+        help="the number of rounds to run each benchmark for (default: 5)",
+    )
+    parser.add_argument(
+        "--memory-calls",
+        type=int,
+        default=100,
+        help="the number of calls to trace memory allocations over (default: 100)",
+    )
+    args = parser.parse_args()
+
+    results = {}
+
+    for name, function in get_benchmarks().items():
+        if args.filter not in name:
+            continue
+
+        # Warm up caches before measuring anything.
+        function()
+
+        ops = measure_time(function, min_time=args.min_time, rounds=args.rounds)
+        results[name] = {
+            "ops_per_sec": statistics.median(ops),
+            "ops_per_sec_best": max(ops),
+            "ops_per_sec_stdev": statistics.stdev(ops) if len(ops) > 1 else 0.0,
+            **measure_memory(function, calls=args.memory_calls),
+        }
+
+        print(
+            f"{name:<40} {results[name]['ops_per_sec']:>12,.0f} ops/s"
+            f" {results[name]['peak_bytes']:>10,} B peak"
+            f" {results[name]['retained_bytes']:>8,} B retained"
+        )
+
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "metadata": {
+                        "commit": get_commit(),
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "signing_algorithm": settings().signing_algorithm,
+                        "internal_token_protection": settings().internal_token_protection,
+                    },
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
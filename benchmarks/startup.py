@@ -0,0 +1,138 @@
+"""
+Measure how long Snowflake takes to import, which is most of the time it takes to start.
+
+Run with `uv run python benchmarks/startup.py`. Each measurement is taken in a fresh Python process.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# How much longer, in milliseconds, importing Snowflake may take than importing FastAPI on its own.
+BUDGET = 320
+
+MEASURE_IMPORT = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def measure_import(module: str) -> float:
+    """
+    Return the number of milliseconds it takes a fresh Python process to import a module.
+    """
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", MEASURE_IMPORT.format(module=module)],
+        capture_output=True,
+        check=True,
+        text=True,
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    ).stdout
+
+    return float(output) * 1000
+
+
+def get_slowest_imports(module: str, count: int) -> list[tuple[str, float]]:
+    """
+    Return the modules that take the longest to import when a module is imported, excluding time spent importing
+    their own dependencies.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    ).stderr
+
+    times = [
+        (match.group(2), int(match.group(1)) / 1000)
+        for match in re.finditer(r"import time:\s+(\d+) \|\s+\d+ \| +(\S+)", stderr)
+    ]
+
+    return sorted(times, key=lambda item: item[1], reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="startup",
+        description="Measure how long Snowflake takes to import.",
+    )
+    parser.add_argument(
+        "-n",
+        "--runs",
+        type=int,
+        default=10,
+        help="the number of times to import each module (default: 10)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=15,
+        help="the number of slowest imports to list (default: 15)",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=BUDGET,
+        help=f"how much longer importing Snowflake may take than importing FastAPI, in milliseconds "
+        f"(default: {BUDGET})",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="exit with a non-zero status if Snowflake is over budget",
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, help="write the results as JSON to this file"
+    )
+    args = parser.parse_args()
+
+    # FastAPI is measured alongside Snowflake so that results don't depend on how fast the machine is. The two are
+    # measured in alternation, and the overhead is taken from each pair, so that the machine getting faster or slower
+    # partway through doesn't skew it.
+    fastapi, snowflake = [], []
+
+    for _ in range(args.runs):
+        fastapi.append(measure_import("fastapi"))
+        snowflake.append(measure_import("snowflake.app"))
+
+    overhead = statistics.median(s - f for f, s in zip(fastapi, snowflake))
+
+    print(f"{'fastapi':<16} {statistics.median(fastapi):>8.1f} ms")
+    print(f"{'snowflake.app':<16} {statistics.median(snowflake):>8.1f} ms")
+    print(
+        f"{'overhead':<16} {overhead:>8.1f} ms "
+        f"({'within' if overhead <= args.budget else 'over'} budget of {args.budget:.0f} ms)\n"
+    )
+
+    print("Slowest imports (excluding their dependencies):")
+
+    for name, duration in get_slowest_imports("snowflake.app", args.top):
+        print(f"  {name:<48} {duration:>8.1f} ms")
+
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "fastapi_ms": fastapi,
+                    "snowflake_ms": snowflake,
+                    "overhead_ms": overhead,
+                    "budget_ms": args.budget,
+                },
+                indent=2,
+            )
+        )
+
+    if args.check and overhead > args.budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,18 @@
+import asyncio
+import logging
+import signal
+import threading
 import typing as t
+from contextlib import asynccontextmanager
 
-import dns.name
-import httpx
 from authlib.common.errors import AuthlibHTTPError
 from authlib.oauth2.rfc6749 import scope_to_list
-from fastapi import Depends, FastAPI, Form, Header, Request
+from fastapi import Body, Depends, FastAPI, Form, Header, Request
 from fastapi.datastructures import URL
 from fastapi.exceptions import HTTPException
-from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.params import Path as PathParam
 from fastapi.params import Query
-from fastapi.responses import JSONResponse, RedirectResponse, Response
+from fastapi.responses import ORJSONResponse, RedirectResponse, Response
 from fastapi.security import (
     HTTPAuthorizationCredentials,
     HTTPBasic,
@@ -19,17 +21,64 @@ from fastapi.security import (
 )
 from httpx import HTTPStatusError
 from joserfc.errors import JoseError
-from pydantic import AfterValidator, validate_email
-from scalar_fastapi import get_scalar_api_reference
+from pydantic import AfterValidator
 
 import snowflake.responses as r
-from snowflake import security, utils
+from snowflake import (
+    clients,
+    executor,
+    metrics,
+    middleware,
+    security,
+    tracing,
+    upstream,
+    utils,
+)
 from snowflake.serializable import (
     SnowflakeAuthorizationData,
     SnowflakeStateData,
 )
 from snowflake.settings import settings
 
+# The maximum number of access tokens that can be introspected in a single request.
+MAX_INTROSPECTION_BATCH_SIZE = 1000
+
+# Settings are validated here, once, so that invalid configuration stops Snowflake from starting.
+settings()
+
+
+def _reload_private_key() -> None:
+    logging.getLogger("uvicorn").info("Received SIGHUP, reloading the private key.")
+    security.reload_private_key()
+    security.load_keys()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    security.load_keys()
+    clients.get_client_registry()
+    utils.get_allowed_webfinger_hosts()
+
+    # SIGHUP makes each worker reload the private key file right away, rather than on its next check for changes.
+    # Signal handlers can only be installed from the main thread, which the lifespan doesn't always run in (e.g.,
+    # under Starlette's TestClient).
+    loop = asyncio.get_running_loop()
+    reload_on_sighup = threading.current_thread() is threading.main_thread()
+
+    if reload_on_sighup:
+        loop.add_signal_handler(signal.SIGHUP, _reload_private_key)
+
+    async with upstream.connection_pool(), metrics.event_loop_monitor():
+        upstream.refresh_discord_metadata()
+        yield
+
+    if reload_on_sighup:
+        loop.remove_signal_handler(signal.SIGHUP)
+
+    executor.shutdown()
+    tracing.shutdown()
+
+
 app = FastAPI(
     title="Snowflake",
     description="Snowflake lets you use Discord as an OpenID Connect provider. "
@@ -43,25 +92,16 @@ app = FastAPI(
     docs_url=None,
     redoc_url=None,
     openapi_url="/openapi.json" if settings().enable_docs else None,
+    lifespan=lifespan,
 )
-app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings().allowed_hosts)
+app.add_middleware(middleware.TransportAndHostMiddleware)
 
+if settings().tracing_exporter != "none":
+    tracing.configure()
+    app.add_middleware(tracing.TracingMiddleware)
 
-@app.middleware("http")
-async def secure_transport_middleware(request: Request, call_next):
-    """
-    Enforce HTTPS for external connections.
-    """
-    if not utils.is_secure_transport(request.url):
-        return JSONResponse(
-            {
-                "detail": "Snowflake must be served over HTTPS. If you're using a reverse proxy, "
-                "see https://github.com/celsiusnarhwal/snowflake#https-and-reverse-proxies."
-            },
-            status_code=400,
-        )
-
-    return await call_next(request)
+if settings().enable_metrics:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 
 # noinspection PyUnusedLocal
@@ -100,6 +140,8 @@ def root(request: Request):
 @app.get("/docs", include_in_schema=False)
 async def docs():
     if settings().enable_docs:
+        from scalar_fastapi import get_scalar_api_reference
+
         return get_scalar_api_reference(
             title="Snowflake",
             openapi_url=app.openapi_url,
@@ -113,6 +155,15 @@ async def docs():
     raise HTTPException(404)
 
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    if settings().enable_metrics:
+        content, media_type = metrics.generate()
+        return Response(content, media_type=media_type)
+
+    raise HTTPException(404)
+
+
 @app.get("/health", summary="Healthcheck", response_class=Response)
 def health():
     """
@@ -161,7 +212,7 @@ async def authorize(
     """
     Clients are directed to this endpoint to begin the authorization process.
     """
-    if not utils.client_is_allowed(client_id):
+    if not (client_policy := clients.get_client_policy(client_id)):
         raise HTTPException(400, f"Client ID {client_id} is not allowed")
 
     if not utils.is_secure_transport(redirect_uri):
@@ -182,13 +233,31 @@ async def authorize(
                 f"(e.g., {fixed_redirect_uri})",
             )
 
+    # Client policies list the URIs that Snowflake's callback endpoint ultimately redirects to.
+    final_redirect_uri = redirect_uri.removeprefix(f"{request.url_for('redirect')}/")
+
+    if (
+        client_policy.redirect_uris is not None
+        and final_redirect_uri not in client_policy.redirect_uris
+    ):
+        raise HTTPException(
+            400,
+            f"Redirect URI {final_redirect_uri} is not allowed for client ID {client_id}",
+        )
+
     if "openid" not in scope_to_list(scope):
         raise HTTPException(400, "openid scope is required")
 
-    discord = utils.get_oauth_client(
-        client_id=client_id,
-        scope=utils.convert_scopes(scope, to_format="discord", output_type=str),
-    )
+    if client_policy.scopes is not None and (
+        disallowed_scopes := set(scope_to_list(scope)) - client_policy.scopes
+    ):
+        raise HTTPException(
+            400,
+            f"Client ID {client_id} may not request these scopes: "
+            + ", ".join(sorted(disallowed_scopes)),
+        )
+
+    discord = utils.get_oauth_client(client_id)
 
     state_data = SnowflakeStateData(
         state=state,
@@ -199,12 +268,12 @@ async def authorize(
 
     authorization_params = {
         **request.query_params,
-        "state": state_data.to_jwt(),
+        "scope": utils.convert_scopes(scope, to_format="discord", output_type=str),
+        "state": await executor.run(state_data.to_jwt),
         "redirect_uri": redirect_uri,
     }
 
-    for param in "client_id", "scope":
-        authorization_params.pop(param, None)
+    authorization_params.pop("client_id", None)
 
     authorization_url_dict = await discord.create_authorization_url(
         **authorization_params
@@ -235,7 +304,7 @@ async def callback(
     """
     Discord must redirect to this endpoint upon successful authorization.
     """
-    state_data = SnowflakeStateData.from_jwt(state)
+    state_data = await executor.run(SnowflakeStateData.from_jwt, state)
 
     if (
         error == "access_denied"
@@ -266,7 +335,7 @@ async def callback(
         )
 
         full_redirect_uri = full_redirect_uri.include_query_params(
-            code=authorization_data.to_jwt()
+            code=await executor.run(authorization_data.to_jwt)
         )
 
     return RedirectResponse(full_redirect_uri, status_code=302)
@@ -362,11 +431,11 @@ async def token(
     if not client_id:
         raise HTTPException(400, "Client ID is required")
 
-    if not utils.client_is_allowed(client_id):
+    if not (client_policy := clients.get_client_policy(client_id)):
         raise HTTPException(400, f"Client ID {client_id} is not allowed")
 
     oidc_metadata = utils.get_discovery_info(request)
-    discord = utils.get_oauth_client(client_id=client_id, client_secret=client_secret)
+    discord = utils.get_oauth_client(client_id, client_secret)
 
     if grant_type == "refresh_token":
         if not refresh_token:
@@ -378,29 +447,49 @@ async def token(
                 "You cannot opt out of receiving a new refresh token when using an existing one",
             )
 
-        async with httpx.AsyncClient() as client:
-            discord_token = (
-                (
-                    await client.post(
-                        discord.access_token_url,
-                        data={
-                            **(await request.form()),
-                            "client_id": client_id,
-                            "client_secret": client_secret,
-                            "refresh_token": refresh_token,
-                        },
-                    )
+        grant = {
+            **(await request.form()),
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "refresh_token": refresh_token,
+        }
+
+        async def refresh() -> dict:
+            discord_metadata = await discord.load_server_metadata()
+
+            with (
+                metrics.track_discord_request("refresh"),
+                tracing.span("discord.refresh"),
+            ):
+                response = await upstream.get_client().post(
+                    discord_metadata["token_endpoint"], data=grant
                 )
-                .raise_for_status()
-                .json()
+
+                if (
+                    response.status_code == 400
+                    and response.json().get("error") == "invalid_grant"
+                ):
+                    security.invalidate_refresh_token(refresh_token)
+
+                discord_token = response.raise_for_status().json()
+
+            return await security.create_tokens(
+                discord=discord,
+                discord_token=discord_token,
+                oidc_metadata=oidc_metadata,
+                refresh_token=refresh_token,
+                token_lifetime=client_policy.token_lifetime,
             )
 
-        return await security.create_tokens(
-            discord=discord,
-            discord_token=discord_token,
-            oidc_metadata=oidc_metadata,
+        # Everything that reaches Discord is part of what makes two grants identical.
+        tokens = await security.refresh_once(
+            refresh, grant=grant, issuer=oidc_metadata["issuer"]
         )
 
+        # Snowflake built this response itself, so it's returned as-is rather than being validated against the
+        # response model. The same goes for the other JSON endpoints.
+        return ORJSONResponse(tokens)
+
     if not redirect_uri:
         raise HTTPException(400, "Redirect URI is required")
 
@@ -412,7 +501,7 @@ async def token(
             400, "Confidential clients cannot opt out of receiving a refresh token"
         )
 
-    authorization_data = SnowflakeAuthorizationData.from_jwt(code)
+    authorization_data = await executor.run(SnowflakeAuthorizationData.from_jwt, code)
 
     token_params = {
         **(await request.form()),
@@ -423,16 +512,23 @@ async def token(
     for param in "client_id", "client_secret":
         token_params.pop(param, None)
 
-    discord_token = await discord.fetch_access_token(**token_params)
+    with (
+        metrics.track_discord_request("token"),
+        tracing.span("discord.token"),
+    ):
+        discord_token = await discord.fetch_access_token(**token_params)
 
-    return await security.create_tokens(
+    tokens = await security.create_tokens(
         discord=discord,
         discord_token=discord_token,
         nonce=authorization_data.nonce,
         oidc_metadata=oidc_metadata,
         include_refresh_token=include_refresh_token,
+        token_lifetime=client_policy.token_lifetime,
     )
 
+    return ORJSONResponse(tokens)
+
 
 @app.get(
     "/userinfo",
@@ -471,33 +567,159 @@ async def userinfo(
     oidc_metadata = utils.get_discovery_info(request)
 
     try:
-        access_token = security.decode_jwt(
+        access_token_claims = await security.verify_access_token(
             credentials.credentials,
-            iss={"essential": True, "value": oidc_metadata["issuer"]},
-            aud={"essential": True, "value": oidc_metadata["userinfo_endpoint"]},
+            issuer=oidc_metadata["issuer"],
+            audience=oidc_metadata["userinfo_endpoint"],
         )
     except (JoseError, ValueError):
         raise HTTPException(401)
 
-    userinfo_claims = {
-        k: v
-        for k, v in access_token.claims.items()
-        if k in oidc_metadata["claims_supported"]
-    }
+    userinfo_claims = utils.get_userinfo_claims(access_token_claims, oidc_metadata)
 
     # This should not be possible but you never know.
     if not userinfo_claims:
         raise HTTPException(403)
 
-    return userinfo_claims
+    return ORJSONResponse(userinfo_claims)
+
+
+async def _authenticate_introspection_client(
+    credentials: t.Annotated[
+        HTTPBasicCredentials,
+        Depends(
+            HTTPBasic(
+                scheme_name="Client ID / Client Secret",
+                description="The authenticating Discord application's client ID (username) and "
+                "client secret (password).",
+            )
+        ),
+    ],
+) -> str:
+    """
+    Require introspection requests to be authenticated with the credentials of a client in the client registry, as
+    per RFC 7662 § 2.1, and return the client's ID.
+    """
+    if not clients.authenticate_client(credentials.username, credentials.password):
+        raise HTTPException(
+            401, "Invalid client credentials", {"WWW-Authenticate": "Basic"}
+        )
+
+    return credentials.username
+
+
+def _get_introspection_result(
+    access_token_claims: dict | None, oidc_metadata: dict, client_id: str
+) -> dict:
+    """
+    Describe an access token as per RFC 7662 § 2.2, given its claims or `None` if it's invalid.
+
+    Tokens issued to clients other than the one introspecting them are reported as inactive, as per RFC 7662 § 4.
+    """
+    if not access_token_claims or access_token_claims.get("azp") != client_id:
+        return {"active": False}
+
+    return {
+        "active": True,
+        "token_type": "Bearer",
+        "client_id": client_id,
+        **{k: access_token_claims[k] for k in ("iss", "aud", "iat", "exp")},
+        **utils.get_userinfo_claims(access_token_claims, oidc_metadata),
+    }
+
+
+@app.post(
+    "/introspect",
+    summary="Token Introspection",
+    response_model=r.IntrospectionResponse,
+    response_model_exclude_none=True,
+    responses={401: {"model": r.HTTPClientErrorResponse}},
+)
+async def introspect(
+    request: Request,
+    client_id: t.Annotated[str, Depends(_authenticate_introspection_client)],
+    token: t.Annotated[
+        str, Form(description="An access token recieved from the `/token` endpoint.")
+    ],
+):
+    """
+    This endpoint recieves an access token and returns whether it's active and, if it is, its claims, as per
+    [RFC 7662](https://datatracker.ietf.org/doc/html/rfc7662).
+
+    Invalid and expired tokens are reported as inactive rather than causing an error. The claims returned are the same
+    as those returned by the [user info endpoint](#GET/userinfo), along with the token's client ID, issuer,
+    audience, and issuance and expiry times.
+
+    Requests must be authenticated with the client ID and client secret of a client in the
+    [client registry](https://github.com/celsiusnarhwal/snowflake#client-registry) via HTTP Basic authentication.
+    Tokens issued to other clients are reported as inactive.
+    """
+    oidc_metadata = utils.get_discovery_info(request)
+
+    (access_token_claims,) = await security.verify_access_tokens(
+        [token],
+        issuer=oidc_metadata["issuer"],
+        audience=oidc_metadata["userinfo_endpoint"],
+    )
+
+    return ORJSONResponse(
+        _get_introspection_result(access_token_claims, oidc_metadata, client_id)
+    )
+
+
+@app.post(
+    "/introspect/batch",
+    summary="Batch Token Introspection",
+    response_model=r.BatchIntrospectionResponse,
+    response_model_exclude_none=True,
+    responses={401: {"model": r.HTTPClientErrorResponse}},
+)
+async def introspect_batch(
+    request: Request,
+    client_id: t.Annotated[str, Depends(_authenticate_introspection_client)],
+    tokens: t.Annotated[
+        list[str],
+        Body(
+            embed=True,
+            max_length=MAX_INTROSPECTION_BATCH_SIZE,
+            description="Access tokens recieved from the `/token` endpoint.",
+        ),
+    ],
+):
+    """
+    This endpoint recieves up to 1000 access tokens and returns the result of [introspecting](#POST/introspect) each
+    one, in the same order.
+    """
+    oidc_metadata = utils.get_discovery_info(request)
+
+    access_token_claims = await security.verify_access_tokens(
+        tokens,
+        issuer=oidc_metadata["issuer"],
+        audience=oidc_metadata["userinfo_endpoint"],
+    )
+
+    return ORJSONResponse(
+        {
+            "results": [
+                _get_introspection_result(claims, oidc_metadata, client_id)
+                for claims in access_token_claims
+            ]
+        }
+    )
 
 
 @app.get("/.well-known/jwks.json", summary="JWKS", response_model=r.JWKSResponse)
-async def jwks():
+async def jwks(request: Request):
     """
     This endpoint returns the public JSON Web Key Set.
+
+    Responses include an `ETag` header and honor `If-None-Match`.
     """
-    return security.get_jwks().as_dict()
+    document, etag = security.get_jwks_document()
+
+    return utils.cached_json_response(
+        request, document, etag=etag, max_age=settings().jwks_cache_lifetime
+    )
 
 
 @app.get(
@@ -515,7 +737,7 @@ async def webfinger(
             description="Must be an email address prepended with `acct:`.",
             example="acct:koumae@kitauji.ed.jp",
         ),
-        AfterValidator(lambda x: "acct:" + validate_email(x.split("acct:")[1])[1]),
+        AfterValidator(utils.normalize_webfinger_resource),
     ],
     rel: t.Annotated[
         str,
@@ -528,21 +750,24 @@ async def webfinger(
 ):
     """
     This endpoint implements limited support for the [WebFinger](https://en.wikipedia.org/wiki/WebFinger) protocol.
+
+    Responses, including HTTP 404 responses, include a `Cache-Control` header.
     """
-    domain = dns.name.from_text(resource.split("@")[1])
+    headers = {
+        "Cache-Control": f"public, max-age={settings().webfinger_cache_lifetime}"
+    }
 
-    if any(
-        domain == name or name.is_wild() and domain.is_subdomain(name.parent())
-        for name in settings().allowed_webfinger_hosts
-    ):
+    if utils.is_webfinger_host_allowed(resource.split("@")[1]):
         response = {"subject": resource, "links": []}
 
         if rel == "http://openid.net/specs/connect/1.0/issuer":
             response["links"].append({"rel": rel, "href": str(request.base_url)})
 
-        return response
+        return ORJSONResponse(response, headers=headers)
 
-    raise HTTPException(404, f"The resource {resource} does not exist on this server")
+    raise HTTPException(
+        404, f"The resource {resource} does not exist on this server", headers
+    )
 
 
 @app.get(
@@ -553,5 +778,14 @@ async def webfinger(
 async def discovery(request: Request):
     """
     This endpoint implements [OpenID Connect Discovery 1.0](https://openid.net/specs/openid-connect-discovery-1_0.html).
+
+    Responses include an `ETag` header and honor `If-None-Match`.
     """
-    return utils.get_discovery_info(request)
+    document = utils.get_discovery_document(request)
+
+    return utils.cached_json_response(
+        request,
+        document.content,
+        etag=document.etag,
+        max_age=settings().discovery_cache_lifetime,
+    )
@@ -0,0 +1,78 @@
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+K = t.TypeVar("K")
+V = t.TypeVar("V")
+
+
+class TTLCache(t.Generic[K, V]):
+    """
+    A bounded, thread-safe, least-recently-used cache whose entries expire after a time-to-live.
+
+    A cache with a `maxsize` or `ttl` of zero stores nothing.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """
+        Return the value for the given key, or `default` if it's missing or expired.
+        """
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        """
+        Store a value for the given key. `ttl` may shorten, but not lengthen, the cache's time-to-live for this entry.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+
+        if not self.maxsize or ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = time.monotonic() + ttl, value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        """
+        Remove the given key from the cache if it's present.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove everything from the cache.
+        """
+        with self._lock:
+            self._data.clear()
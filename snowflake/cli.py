@@ -1,11 +1,186 @@
+import argparse
+import importlib.util
 import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
 
-from joserfc.jwk import RSAKey
+from snowflake import keys
 
 
 def keygen():
-    key = RSAKey.generate_key(
-        2048, parameters={"use": "sig", "alg": "RS256"}, private=True
+    parser = argparse.ArgumentParser(
+        prog="keygen",
+        description="Generate a private key for use with SNOWFLAKE_PRIVATE_KEY.",
     )
+    parser.add_argument(
+        "-a",
+        "--algorithm",
+        choices=keys.SIGNING_ALGORITHMS,
+        default="RS256",
+        help="the signing algorithm the key is for (default: RS256)",
+    )
+    parser.add_argument(
+        "--internal",
+        action="store_true",
+        help="generate a symmetric key for use with SNOWFLAKE_INTERNAL_KEY instead",
+    )
+    args = parser.parse_args()
+
+    if args.internal:
+        key = keys.generate_internal_key()
+    else:
+        key = keys.generate_key(args.algorithm)
 
     print(json.dumps(key.as_dict(private=True)))
+
+
+def rotate_key():
+    parser = argparse.ArgumentParser(
+        prog="rotate-key",
+        description="Rotate the private key Snowflake signs its JWTs with. Running Snowflake instances pick up "
+        "changes automatically.",
+    )
+    parser.add_argument(
+        "action",
+        choices=["stage", "promote", "retire"],
+        help="stage: add a new key for SNOWFLAKE_SIGNING_ALGORITHM that is published but not yet used for signing; "
+        "promote: start signing with the newest key; "
+        "retire: remove keys older than the active key",
+    )
+    args = parser.parse_args()
+
+    from pydantic import ValidationError
+
+    from snowflake.settings import settings
+
+    if os.getenv("SNOWFLAKE_PRIVATE_KEY"):
+        sys.exit(
+            "SNOWFLAKE_PRIVATE_KEY is set. To rotate a custom private key, set SNOWFLAKE_PRIVATE_KEY to a JSON "
+            "Web Key Set containing both the new and old keys."
+        )
+
+    try:
+        signing_algorithm = settings().signing_algorithm
+    except ValidationError as e:
+        sys.exit(str(e))
+
+    with keys.key_file_lock():
+        try:
+            data = json.loads(keys.PRIVATE_KEY_FILE.read_text())
+        except FileNotFoundError:
+            sys.exit(
+                f"{keys.PRIVATE_KEY_FILE} does not exist. Start Snowflake to create it."
+            )
+
+        # Keys are stored newest-first; keys before the active key are staged and keys after it are retiring.
+        active_key = keys.import_key_ring(data).keys[0]
+        key_list = keys.import_key_list(data)
+
+        match args.action:
+            case "stage":
+                new_key = keys.generate_key(signing_algorithm)
+                key_list = [new_key, *key_list]
+                print(f"Staged key {new_key.kid}.")
+            case "promote":
+                # Snowflake replaces an active key that isn't for SNOWFLAKE_SIGNING_ALGORITHM with a new one.
+                if key_list[0].alg != signing_algorithm:
+                    sys.exit(
+                        f"Key {key_list[0].kid} is for {key_list[0].alg}, but SNOWFLAKE_SIGNING_ALGORITHM is "
+                        f"{signing_algorithm}. Stage a new key instead."
+                    )
+
+                active_key = key_list[0]
+                print(f"Key {active_key.kid} is now the active signing key.")
+            case "retire":
+                active_index = [key.kid for key in key_list].index(active_key.kid)
+                for key in key_list[active_index + 1 :]:
+                    print(f"Retired key {key.kid}.")
+                key_list = key_list[: active_index + 1]
+
+        keys.write_key_file(keys.export_key_ring(key_list, active_key))
+
+
+def _available_cpus() -> int:
+    """
+    Count the CPU cores available to Snowflake, respecting both CPU affinity and cgroup CPU quotas (e.g., Docker's
+    `--cpus` option).
+    """
+    cpus = os.process_cpu_count() or 1
+
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+    except (OSError, ValueError):
+        return cpus
+
+    if quota == "max":
+        return cpus
+
+    return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+
+
+def serve():
+    parser = argparse.ArgumentParser(
+        prog="serve",
+        description="Run Snowflake with one worker process per available CPU core.",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="the address to bind to (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000, help="the port to bind to (default: 8000)"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="the number of worker processes (default: SNOWFLAKE_WORKERS, or the number of available CPU cores)",
+    )
+    args = parser.parse_args()
+
+    import uvicorn.main
+
+    from snowflake import security
+    from snowflake.settings import settings
+
+    workers = args.workers or settings().workers or _available_cpus()
+
+    # Create the keys before any workers start so that they don't race to create them and all sign with the same key.
+    security.load_keys()
+
+    uvicorn_args = [
+        "--host",
+        args.host,
+        "--port",
+        str(args.port),
+        "--workers",
+        str(workers),
+        "--loop",
+        "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "--http",
+        "httptools" if importlib.util.find_spec("httptools") else "h11",
+        "snowflake.app:app",
+    ]
+
+    metrics_dir = None
+
+    # Each worker keeps its own metrics, so they need somewhere to share them for /metrics to report all of them.
+    if (
+        settings().enable_metrics
+        and workers > 1
+        and not os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    ):
+        metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(
+            prefix="snowflake-metrics-"
+        )
+
+    try:
+        uvicorn.main.main(uvicorn_args, prog_name="serve")
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
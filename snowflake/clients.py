@@ -0,0 +1,107 @@
+import hmac
+import json
+import tomllib
+import typing as t
+from functools import lru_cache
+from pathlib import Path
+
+from pydantic import BaseModel, ConfigDict, Field, SecretStr, TypeAdapter
+
+from snowflake import utils
+from snowflake.settings import Duration, settings
+
+# How often, in seconds, the client registry file is checked for changes.
+CLIENTS_FILE_CHECK_INTERVAL = 1
+
+Scope = t.Literal["openid", "profile", "email", "groups"]
+
+
+class ClientPolicy(BaseModel):
+    """
+    What a client is permitted to do. Restrictions that are `None` don't apply.
+    """
+
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    redirect_uris: frozenset[str] | None = None
+    scopes: frozenset[Scope] | None = None
+    token_lifetime: t.Annotated[Duration, Field(ge=60)] | None = None
+    client_secret: SecretStr | None = None
+
+
+class ClientRegistry(t.NamedTuple):
+    policies: dict[str, ClientPolicy]
+    default_policy: ClientPolicy | None
+
+    def get(self, client_id: str) -> ClientPolicy | None:
+        return self.policies.get(client_id, self.default_policy)
+
+
+_policies_adapter = TypeAdapter(dict[str, ClientPolicy])
+
+
+def _read_clients_file(path: Path) -> ClientRegistry:
+    """
+    Read a client registry file.
+    """
+    with path.open("rb") as file:
+        data = tomllib.load(file) if path.suffix == ".toml" else json.load(file)
+
+    policies = _policies_adapter.validate_python(data)
+
+    return ClientRegistry(policies, policies.pop("*", None))
+
+
+# The registry is required to be valid when Snowflake starts, so there's nothing to fall back to if it isn't.
+_clients_file = utils.ReloadingFile(
+    _read_clients_file,
+    description="client registry",
+    check_interval=CLIENTS_FILE_CHECK_INTERVAL,
+)
+
+
+@lru_cache
+def _get_allowed_clients_registry() -> ClientRegistry:
+    """
+    Build a client registry from `SNOWFLAKE_ALLOWED_CLIENTS`.
+    """
+    allowed_clients = settings().allowed_clients
+
+    return ClientRegistry(
+        {client_id: ClientPolicy() for client_id in allowed_clients},
+        ClientPolicy() if "*" in allowed_clients else None,
+    )
+
+
+def get_client_registry() -> ClientRegistry:
+    """
+    Get the client registry, reloading it if `SNOWFLAKE_CLIENTS_FILE` has changed.
+
+    If `SNOWFLAKE_CLIENTS_FILE` isn't set, the registry is built from `SNOWFLAKE_ALLOWED_CLIENTS` instead.
+    """
+    if not settings().clients_file:
+        return _get_allowed_clients_registry()
+
+    return _clients_file.get(settings().clients_file)
+
+
+def get_client_policy(client_id: str) -> ClientPolicy | None:
+    """
+    Get the policy for a client ID, or `None` if the client ID is not allowed.
+    """
+    return get_client_registry().get(client_id)
+
+
+def authenticate_client(client_id: str, client_secret: str) -> bool:
+    """
+    Check a client ID and client secret against the client registry. Only clients listed in the registry with a
+    `client_secret` can be authenticated.
+    """
+    policy = get_client_registry().policies.get(client_id)
+
+    if not (policy and policy.client_secret):
+        return False
+
+    return hmac.compare_digest(
+        policy.client_secret.get_secret_value().encode(), client_secret.encode()
+    )
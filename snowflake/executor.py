@@ -0,0 +1,142 @@
+import asyncio
+import contextvars
+import functools
+import time
+import typing as t
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from snowflake import metrics
+from snowflake.settings import settings
+
+T = t.TypeVar("T")
+
+_executor: Executor | None = None
+_backlog = 0
+
+
+def get_executor() -> Executor:
+    """
+    Get the executor that JWTs are signed and verified in, creating it if necessary.
+    """
+    global _executor
+
+    if not _executor:
+        match settings().crypto_executor:
+            case "process":
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                from snowflake import security
+
+                # Forking a process that's already running threads is unsafe, so workers are started fresh.
+                _executor = ProcessPoolExecutor(
+                    settings().crypto_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=security.load_keys,
+                )
+            case _:
+                _executor = ThreadPoolExecutor(
+                    settings().crypto_workers, thread_name_prefix="snowflake-crypto"
+                )
+
+    return _executor
+
+
+def shutdown() -> None:
+    """
+    Shut down the executor if it was ever created.
+    """
+    global _executor
+
+    if _executor:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def backlog() -> int:
+    """
+    Return the number of operations currently waiting for or running in the executor.
+    """
+    return _backlog
+
+
+class _RaisedError(t.NamedTuple):
+    """
+    An exception raised in a worker process, in a form that reaches the parent process intact. Pickling exceptions
+    directly recreates them from their `args` alone, which changes or breaks many (e.g., Authlib's and FastAPI's).
+    """
+
+    type: type[Exception]
+    args: tuple
+    attributes: dict
+
+    def restore(self) -> Exception:
+        error = self.type.__new__(self.type)
+        error.args = self.args
+        error.__dict__.update(self.attributes)
+
+        return error
+
+
+def _run_timed(
+    function: t.Callable[..., T], args: tuple, kwargs: dict, capture_errors: bool
+) -> tuple[float, T | _RaisedError]:
+    started_at = time.monotonic()
+
+    try:
+        return started_at, function(*args, **kwargs)
+    except Exception as e:
+        if not capture_errors:
+            raise
+
+        return started_at, _RaisedError(type(e), e.args, vars(e))
+
+
+async def run(function: t.Callable[..., T], /, *args: t.Any, **kwargs: t.Any) -> T:
+    """
+    Call a function that signs or verifies JWTs without blocking the event loop, as per `SNOWFLAKE_CRYPTO_EXECUTOR`.
+
+    If `SNOWFLAKE_CRYPTO_MAX_BACKLOG` operations are already waiting for or running in the executor, an HTTP 503 error
+    is raised instead.
+    """
+    global _backlog
+
+    if settings().crypto_executor == "inline":
+        return function(*args, **kwargs)
+
+    if _backlog >= settings().crypto_max_backlog:
+        metrics.record_crypto_rejection()
+        raise HTTPException(
+            503, "Snowflake is overloaded. Try again later.", {"Retry-After": "1"}
+        )
+
+    job = functools.partial(
+        _run_timed,
+        function,
+        args,
+        kwargs,
+        capture_errors=settings().crypto_executor == "process",
+    )
+
+    if settings().crypto_executor == "thread":
+        # Threads can share the current context, which keeps JWT spans inside the request's trace.
+        job = functools.partial(contextvars.copy_context().run, job)
+
+    _backlog += 1
+    submitted_at = time.monotonic()
+
+    try:
+        started_at, result = await asyncio.get_running_loop().run_in_executor(
+            get_executor(), job
+        )
+    finally:
+        _backlog -= 1
+
+    metrics.record_crypto_queue_wait(started_at - submitted_at)
+
+    if isinstance(result, _RaisedError):
+        raise result.restore()
+
+    return result
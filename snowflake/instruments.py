@@ -0,0 +1,79 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# This module is only imported if metrics are enabled, so that Prometheus' client isn't loaded unless it's needed.
+
+# JWT operations take microseconds to milliseconds, well below Prometheus' default buckets.
+JWT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+HTTP_REQUESTS = Counter(
+    "snowflake_http_requests",
+    "HTTP requests handled by Snowflake.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "snowflake_http_request_duration_seconds",
+    "Time taken to handle HTTP requests.",
+    ["method", "route"],
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "snowflake_http_requests_in_flight",
+    "HTTP requests currently being handled by Snowflake.",
+    multiprocess_mode="livesum",
+)
+DISCORD_REQUEST_DURATION = Histogram(
+    "snowflake_discord_request_duration_seconds",
+    "Time taken by requests to Discord, including time spent waiting on rate limits.",
+    ["call"],
+)
+DISCORD_REQUEST_ERRORS = Counter(
+    "snowflake_discord_request_errors",
+    "Requests to Discord that failed.",
+    ["call"],
+)
+DISCORD_REQUESTS_IN_FLIGHT = Gauge(
+    "snowflake_discord_requests_in_flight",
+    "Requests to Discord currently in progress.",
+    multiprocess_mode="livesum",
+)
+DISCORD_RATE_LIMIT_QUEUE_DEPTH = Gauge(
+    "snowflake_discord_rate_limit_queue_depth",
+    "Requests to Discord currently waiting on a rate limit.",
+    multiprocess_mode="livesum",
+)
+JWT_DURATION = Histogram(
+    "snowflake_jwt_duration_seconds",
+    "Time taken to sign and verify JWTs.",
+    ["operation"],
+    buckets=JWT_BUCKETS,
+)
+CRYPTO_BACKLOG = Gauge(
+    "snowflake_crypto_backlog",
+    "JWT operations waiting for or running in the crypto executor.",
+    multiprocess_mode="livesum",
+)
+CRYPTO_QUEUE_WAIT = Histogram(
+    "snowflake_crypto_queue_wait_seconds",
+    "Time JWT operations spent waiting for the crypto executor.",
+    buckets=JWT_BUCKETS,
+)
+CRYPTO_REJECTIONS = Counter(
+    "snowflake_crypto_rejections",
+    "JWT operations rejected because the crypto executor's backlog was full.",
+)
+EVENT_LOOP_LAG = Histogram(
+    "snowflake_event_loop_lag_seconds",
+    "How late the event loop runs scheduled callbacks.",
+    buckets=JWT_BUCKETS[3:] + (0.25, 0.5, 1.0),
+)
+CACHE_HITS = Counter(
+    "snowflake_cache_hits", "Cache lookups that found an entry.", ["cache"]
+)
+CACHE_MISSES = Counter(
+    "snowflake_cache_misses", "Cache lookups that found nothing.", ["cache"]
+)
+CACHE_ENTRIES = Gauge(
+    "snowflake_cache_entries",
+    "Entries currently cached.",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
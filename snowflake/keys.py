@@ -0,0 +1,121 @@
+import fcntl
+import json
+import os
+import typing as t
+from contextlib import contextmanager
+from pathlib import Path
+
+from joserfc.jwk import ECKey, Key, KeySet, OctKey, OKPKey, RSAKey
+
+PRIVATE_KEY_FILE = Path(__file__).parent / "data" / "keys" / "jwt_private_key.json"
+INTERNAL_KEY_FILE = Path(__file__).parent / "data" / "keys" / "internal_key.json"
+
+SigningAlgorithm = t.Literal["RS256", "ES256", "EdDSA"]
+SIGNING_ALGORITHMS: list[str] = list(t.get_args(SigningAlgorithm))
+
+
+def generate_key(algorithm: SigningAlgorithm = "RS256") -> Key:
+    """
+    Generate a new private key for the given signing algorithm.
+    """
+    parameters = {"use": "sig", "alg": algorithm}
+
+    match algorithm:
+        case "RS256":
+            return RSAKey.generate_key(2048, parameters, private=True, auto_kid=True)
+        case "ES256":
+            return ECKey.generate_key("P-256", parameters, private=True, auto_kid=True)
+        case "EdDSA":
+            return OKPKey.generate_key(
+                "Ed25519", parameters, private=True, auto_kid=True
+            )
+
+    raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+
+def generate_internal_key() -> OctKey:
+    """
+    Generate a new symmetric key for protecting tokens that only Snowflake reads.
+    """
+    return OctKey.generate_key(256, private=True, auto_kid=True)
+
+
+def import_internal_key(data: dict) -> OctKey:
+    """
+    Import a symmetric key for protecting tokens that only Snowflake reads.
+    """
+    # OctKey would otherwise take a string to be the raw key.
+    if not isinstance(data, dict):
+        raise ValueError("Internal keys must be JSON Web Keys")
+
+    key = OctKey.import_key(data)
+
+    if len(key.raw_value) != 32:
+        raise ValueError("Internal keys must be 256-bit symmetric keys")
+
+    return key
+
+
+def import_key_list(data: dict) -> list[Key]:
+    """
+    Import the keys in a key ring in the order they're stored in, which is newest-first.
+    """
+    return KeySet.import_key_set(data if "keys" in data else {"keys": [data]}).keys
+
+
+def import_key_ring(data: dict) -> KeySet:
+    """
+    Import a key ring from either a single JSON Web Key or a JSON Web Key Set.
+
+    The active signing key is the key identified by the set's `active_kid` member, or its first key if there is
+    no such member. The active key always comes first in the returned key set; any other keys are only used to
+    verify tokens.
+    """
+    keys = KeySet(import_key_list(data))
+
+    if not keys.keys:
+        raise ValueError("Key sets must contain at least one key")
+
+    active_key = (
+        keys.get_by_kid(data["active_kid"]) if data.get("active_kid") else keys.keys[0]
+    )
+
+    return KeySet([active_key, *(key for key in keys.keys if key is not active_key)])
+
+
+def export_key_ring(keys: list[Key], active_key: Key) -> dict:
+    """
+    Export a key ring as a JSON Web Key Set with an `active_kid` member. `keys` should be newest-first.
+    """
+    return {
+        "keys": [key.as_dict(private=True) for key in keys],
+        "active_kid": active_key.kid,
+    }
+
+
+@contextmanager
+def key_file_lock() -> t.Iterator[None]:
+    """
+    Hold an exclusive, cross-process lock on Snowflake's key files while the context is active.
+    """
+    PRIVATE_KEY_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+    with PRIVATE_KEY_FILE.with_suffix(".lock").open("w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_key_file(data: dict, path: Path = PRIVATE_KEY_FILE) -> None:
+    """
+    Atomically write a key or key ring to a key file, which is the private key file by default.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first so that readers never see a partially-written key.
+    temp_file = path.with_suffix(f".{os.getpid()}.tmp")
+    temp_file.write_text(json.dumps(data))
+    temp_file.replace(path)
@@ -0,0 +1,217 @@
+import asyncio
+import os
+import time
+import typing as t
+from contextlib import asynccontextmanager, contextmanager
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from snowflake.settings import settings
+
+# How often, in seconds, the event loop's responsiveness is sampled.
+EVENT_LOOP_LAG_INTERVAL = 0.25
+
+_recorded_cache_counts: dict[str, tuple[int, int]] = {}
+
+
+def _record_tracked_metrics() -> None:
+    """
+    Record metrics that are tracked elsewhere in Snowflake: cache statistics, the number of requests to Discord
+    waiting on rate limits, and the crypto executor's backlog.
+    """
+    from snowflake import executor, instruments, security, upstream
+
+    caches = {
+        "claims": security.claims_cache(),
+        "verified_tokens": security.verified_token_cache(),
+        "refresh_replays": security.refresh_replay_cache(),
+    }
+
+    for name, cache in caches.items():
+        hits, misses = _recorded_cache_counts.get(name, (0, 0))
+
+        instruments.CACHE_HITS.labels(name).inc(cache.hits - hits)
+        instruments.CACHE_MISSES.labels(name).inc(cache.misses - misses)
+        instruments.CACHE_ENTRIES.labels(name).set(len(cache))
+
+        _recorded_cache_counts[name] = cache.hits, cache.misses
+
+    instruments.DISCORD_RATE_LIMIT_QUEUE_DEPTH.set(upstream.queue_depth())
+    instruments.CRYPTO_BACKLOG.set(executor.backlog())
+
+
+def is_multiprocess() -> bool:
+    """
+    Whether metrics are being shared between multiple worker processes.
+    """
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def generate() -> tuple[bytes, str]:
+    """
+    Return the current metrics in the Prometheus text format, along with the format's media type. If metrics are being
+    shared between multiple worker processes, the metrics of all of them are combined.
+    """
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        CollectorRegistry,
+        generate_latest,
+        multiprocess,
+    )
+
+    _record_tracked_metrics()
+
+    if not is_multiprocess():
+        return generate_latest(), CONTENT_TYPE_LATEST
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Record the number, duration, and outcome of HTTP requests.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        from snowflake import instruments
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        start = time.perf_counter()
+        instruments.HTTP_REQUESTS_IN_FLIGHT.inc()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            instruments.HTTP_REQUESTS_IN_FLIGHT.dec()
+
+            # Routes are labelled by their path templates so that the number of label values stays bounded.
+            route = scope["route"].path if "route" in scope else "unmatched"
+
+            instruments.HTTP_REQUEST_DURATION.labels(scope["method"], route).observe(
+                time.perf_counter() - start
+            )
+            instruments.HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+
+
+@contextmanager
+def track_discord_request(call: str) -> t.Iterator[None]:
+    """
+    Record the duration and outcome of a request to Discord.
+    """
+    if not settings().enable_metrics:
+        yield
+        return
+
+    from snowflake import instruments
+
+    start = time.perf_counter()
+    instruments.DISCORD_REQUESTS_IN_FLIGHT.inc()
+
+    try:
+        yield
+    except Exception:
+        instruments.DISCORD_REQUEST_ERRORS.labels(call).inc()
+        raise
+    finally:
+        instruments.DISCORD_REQUESTS_IN_FLIGHT.dec()
+        instruments.DISCORD_REQUEST_DURATION.labels(call).observe(
+            time.perf_counter() - start
+        )
+
+
+@contextmanager
+def track_jwt(operation: str) -> t.Iterator[None]:
+    """
+    Record the duration of a JWT operation.
+    """
+    if not settings().enable_metrics:
+        yield
+        return
+
+    from snowflake import instruments
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        instruments.JWT_DURATION.labels(operation).observe(time.perf_counter() - start)
+
+
+def record_crypto_queue_wait(seconds: float) -> None:
+    """
+    Record how long a JWT operation waited for the crypto executor.
+    """
+    if settings().enable_metrics:
+        from snowflake import instruments
+
+        instruments.CRYPTO_QUEUE_WAIT.observe(seconds)
+
+
+def record_crypto_rejection() -> None:
+    """
+    Record that a JWT operation was rejected because the crypto executor's backlog was full.
+    """
+    if settings().enable_metrics:
+        from snowflake import instruments
+
+        instruments.CRYPTO_REJECTIONS.inc()
+
+
+async def _monitor_event_loop() -> None:
+    """
+    Measure how late the event loop wakes up from sleeps, which reflects how long callbacks are blocking it.
+    """
+    from snowflake import instruments
+
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        instruments.EVENT_LOOP_LAG.observe(
+            max(0.0, time.perf_counter() - start - EVENT_LOOP_LAG_INTERVAL)
+        )
+
+        # Other workers can't see this worker's caches, so their statistics are recorded periodically as well as
+        # when metrics are requested.
+        _record_tracked_metrics()
+
+
+@asynccontextmanager
+async def event_loop_monitor() -> t.AsyncIterator[None]:
+    """
+    Monitor the event loop's responsiveness while the context is active, if metrics are enabled.
+    """
+    if not settings().enable_metrics:
+        yield
+        return
+
+    task = asyncio.create_task(_monitor_event_loop())
+
+    try:
+        yield
+    finally:
+        task.cancel()
+
+        if is_multiprocess():
+            from prometheus_client import multiprocess
+
+            # Stop counting this worker's gauges towards the combined totals.
+            multiprocess.mark_process_dead(os.getpid())
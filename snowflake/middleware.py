@@ -0,0 +1,90 @@
+from starlette.datastructures import URL
+from starlette.responses import JSONResponse, PlainTextResponse, RedirectResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from snowflake import utils
+from snowflake.settings import settings
+
+
+def _get_hostname(host: str) -> str:
+    """
+    Strip the port, and the brackets around IPv6 addresses, from a `Host` header.
+    """
+    if host.startswith("["):
+        return host[1 : host.find("]")]
+
+    return host.partition(":")[0]
+
+
+class TransportAndHostMiddleware:
+    """
+    Enforce HTTPS for external connections and reject requests for hosts not permitted by `SNOWFLAKE_ALLOWED_HOSTS`,
+    in that order.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+        allowed_hosts = [host.lower() for host in settings().allowed_hosts]
+
+        self.allow_any_host = "*" in allowed_hosts
+        self.exact_hosts = {host for host in allowed_hosts if not host.startswith("*")}
+        self.wildcard_suffixes = tuple(
+            host[1:] for host in allowed_hosts if host.startswith("*.")
+        )
+        self.www_redirect_hosts = {
+            host.removeprefix("www.")
+            for host in self.exact_hosts
+            if host.startswith("www.")
+        }
+        self.secure_hostnames = (
+            frozenset(utils.LOOPBACK_HOSTS)
+            if settings().treat_loopback_as_secure
+            else frozenset()
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        host = None
+
+        for name, value in scope["headers"]:
+            if name == b"host":
+                host = value.decode("latin-1").lower()
+                break
+
+        if scope["scheme"] != "https":
+            if host is not None:
+                hostname = _get_hostname(host)
+            elif scope.get("server"):
+                hostname = scope["server"][0]
+            else:
+                hostname = ""
+
+            if hostname not in self.secure_hostnames:
+                response = JSONResponse(
+                    {
+                        "detail": "Snowflake must be served over HTTPS. If you're using a reverse proxy, "
+                        "see https://github.com/celsiusnarhwal/snowflake#https-and-reverse-proxies."
+                    },
+                    status_code=400,
+                )
+
+                return await response(scope, receive, send)
+
+        if not self.allow_any_host:
+            hostname = _get_hostname(host or "")
+
+            if hostname not in self.exact_hosts and not (
+                self.wildcard_suffixes and hostname.endswith(self.wildcard_suffixes)
+            ):
+                if hostname in self.www_redirect_hosts:
+                    url = URL(scope=scope)
+                    response = RedirectResponse(url.replace(netloc="www." + url.netloc))
+                else:
+                    response = PlainTextResponse("Invalid host header", status_code=400)
+
+                return await response(scope, receive, send)
+
+        await self.app(scope, receive, send)
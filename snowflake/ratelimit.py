@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+# Bucket state is swept for expired entries once there are more than this many.
+MAX_TRACKED_BUCKETS = 10000
+
+
+@dataclass
+class _Bucket:
+    # Until Discord describes a bucket in its response headers, requests are let through one at a time to probe it.
+    # A limit of `None` means Discord didn't describe it, and it isn't limited.
+    limit: int | None = 1
+    remaining: int = 1
+    reset_at: float = 0.0
+    window: float = 0.0
+    pending: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    probe_done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def refill(self, now: float) -> None:
+        """
+        Start a new window if the current one has passed.
+        """
+        if self.limit and self.window and self.reset_at <= now:
+            self.remaining = self.limit - self.pending
+            self.reset_at = now + self.window
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    A transport that follows Discord's rate limits.
+
+    Discord's `X-RateLimit-*` response headers are used to track per-route buckets, which Discord applies
+    separately to every token, as well as the global rate limit. Requests that would exceed a limit are held until
+    it resets, and HTTP 429 responses are retried after the delay Discord asks for. If a request would have to wait
+    longer than `max_wait` seconds, an HTTP 429 response is returned immediately instead.
+
+    Requests waiting on the same bucket are let through one at a time, so that they're spread across the bucket's
+    later windows rather than all being sent when it resets.
+    """
+
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, *, max_retries: int, max_wait: float
+    ):
+        self.transport = transport
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+
+        #: The number of requests currently waiting on a rate limit.
+        self.queue_depth = 0
+
+        self._routes: dict[str, str] = {}
+        self._buckets: dict[tuple[str, str], _Bucket] = {}
+        self._global_reset_at = 0.0
+
+    @staticmethod
+    def _get_route(request: httpx.Request) -> str:
+        return f"{request.method} {request.url.host}{request.url.path}"
+
+    @staticmethod
+    def _get_identity(request: httpx.Request) -> str:
+        authorization = request.headers.get("authorization", "")
+        return hashlib.sha256(authorization.encode()).hexdigest()
+
+    def _get_bucket(self, route: str, identity: str) -> _Bucket:
+        key = self._routes.get(route, route), identity
+
+        if not (bucket := self._buckets.get(key)):
+            bucket = self._buckets[key] = _Bucket()
+
+        return bucket
+
+    async def _reserve(
+        self, route: str, identity: str, deadline: float
+    ) -> _Bucket | float:
+        """
+        Wait until a request to a route may be sent, and reserve it from the route's bucket. If that would mean
+        waiting past the deadline, the delay that would be needed is returned instead.
+        """
+        while True:
+            bucket = self._get_bucket(route, identity)
+
+            try:
+                await asyncio.wait_for(
+                    bucket.lock.acquire(), max(deadline - time.monotonic(), 0)
+                )
+            except TimeoutError:
+                return self.max_wait
+
+            try:
+                # The route's bucket may have been replaced once Discord identified it.
+                while bucket is self._get_bucket(route, identity):
+                    now = time.monotonic()
+                    bucket.refill(now)
+
+                    if bucket.limit and bucket.remaining <= 0 and not bucket.window:
+                        try:
+                            await asyncio.wait_for(
+                                bucket.probe_done.wait(), max(deadline - now, 0)
+                            )
+                        except TimeoutError:
+                            return self.max_wait
+
+                        continue
+
+                    delay = self._global_reset_at - now
+
+                    if bucket.limit and bucket.remaining <= 0:
+                        delay = max(delay, bucket.reset_at - now)
+
+                    if delay <= 0:
+                        if not bucket.window:
+                            bucket.probe_done = asyncio.Event()
+
+                        bucket.remaining -= 1
+                        bucket.pending += 1
+
+                        return bucket
+
+                    if now + delay > deadline:
+                        return delay
+
+                    await asyncio.sleep(delay)
+            finally:
+                bucket.lock.release()
+
+    def _release(self, bucket: _Bucket) -> None:
+        """
+        Give back a reservation for a request that was never answered.
+        """
+        bucket.remaining += 1
+        bucket.pending -= 1
+        bucket.probe_done.set()
+
+    def _update_bucket(
+        self, bucket: _Bucket, route: str, identity: str, response: httpx.Response
+    ) -> None:
+        headers = response.headers
+        bucket.pending -= 1
+
+        if bucket_id := headers.get("x-ratelimit-bucket"):
+            self._routes[route] = bucket_id
+
+        try:
+            limit = int(headers["x-ratelimit-limit"])
+            remaining = int(headers["x-ratelimit-remaining"])
+            reset_after = float(headers["x-ratelimit-reset-after"])
+        except (KeyError, ValueError):
+            if not bucket.window:
+                bucket.limit = None
+
+            bucket.probe_done.set()
+            return
+
+        now = time.monotonic()
+        key = self._routes.get(route, route), identity
+
+        if (current := self._buckets.setdefault(key, bucket)) is bucket and key != (
+            route,
+            identity,
+        ):
+            self._buckets.pop((route, identity), None)
+
+        # Requests still awaiting a response have already been counted against the bucket, but Discord may not have
+        # counted them yet.
+        remaining -= current.pending
+
+        if current.reset_at > now:
+            remaining = min(remaining, current.remaining)
+
+        current.limit = limit
+        current.remaining = remaining
+        current.reset_at = now + reset_after
+        current.window = max(current.window, reset_after)
+
+        bucket.probe_done.set()
+
+        if len(self._buckets) > MAX_TRACKED_BUCKETS:
+            self._buckets = {
+                key: bucket
+                for key, bucket in self._buckets.items()
+                if bucket.reset_at > now or bucket.pending or bucket.lock.locked()
+            }
+
+    async def _get_retry_after(self, response: httpx.Response) -> float:
+        await response.aread()
+
+        try:
+            return float(response.json()["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return float(response.headers.get("retry-after", 1))
+
+    @staticmethod
+    def _too_many_requests(request: httpx.Request, delay: float) -> httpx.Response:
+        return httpx.Response(
+            429,
+            headers={"Retry-After": str(int(delay) + 1)},
+            json={"message": "You are being rate limited.", "retry_after": delay},
+            request=request,
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        route = self._get_route(request)
+        identity = self._get_identity(request)
+
+        for attempt in range(self.max_retries + 1):
+            self.queue_depth += 1
+
+            try:
+                bucket = await self._reserve(
+                    route, identity, time.monotonic() + self.max_wait
+                )
+            finally:
+                self.queue_depth -= 1
+
+            if not isinstance(bucket, _Bucket):
+                return self._too_many_requests(request, bucket)
+
+            try:
+                response = await self.transport.handle_async_request(request)
+            except BaseException:
+                self._release(bucket)
+                raise
+
+            self._update_bucket(bucket, route, identity, response)
+
+            if response.status_code != 429:
+                return response
+
+            retry_after = await self._get_retry_after(response)
+            reset_at = time.monotonic() + retry_after
+
+            if (
+                response.headers.get("x-ratelimit-global") == "true"
+                or response.headers.get("x-ratelimit-scope") == "global"
+            ):
+                self._global_reset_at = max(self._global_reset_at, reset_at)
+            else:
+                bucket = self._get_bucket(route, identity)
+                bucket.limit = bucket.limit or 1
+                bucket.remaining = min(bucket.remaining, 0)
+                bucket.reset_at = max(bucket.reset_at, reset_at)
+                bucket.window = bucket.window or retry_after
+
+            logging.getLogger("uvicorn").warning(
+                f"Discord rate limited {route} (retry after {retry_after:.2f}s, attempt {attempt + 1})."
+            )
+
+            if attempt == self.max_retries or retry_after > self.max_wait:
+                return response
+
+            await response.aclose()
+
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
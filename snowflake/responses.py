@@ -22,12 +22,38 @@ class UserInfoResponse(BaseModel, title="User Info"):
     groups: list[str] = None
 
 
+class IntrospectionResponse(BaseModel, title="Introspection"):
+    active: bool
+    token_type: t.Literal["Bearer"] = Field(None, title="Token Type")
+    client_id: str = Field(None, title="Client ID")
+    iss: HttpUrl = Field(None, title="Issuer")
+    aud: HttpUrl = Field(None, title="Audience")
+    iat: int = Field(None, title="Issued At")
+    exp: int = Field(None, title="Expires At")
+    sub: str = Field(None, title="Subject")
+    name: str = None
+    preferred_username: str = None
+    locale: str = None
+    picture: HttpUrl = None
+    email: str = None
+    email_verified: bool = None
+    groups: list[str] = None
+
+
+class BatchIntrospectionResponse(BaseModel, title="Batch Introspection"):
+    results: list[IntrospectionResponse]
+
+
 class JWKSResponse(BaseModel, title="JSON Web Key Set"):
     class JWK(BaseModel, title="JSON Web Key"):
-        n: str = Field(title="Modulus")
-        e: str = Field(title="Exponent")
-        kty: t.Literal["RSA"] = Field(title="Key Type")
+        n: str = Field(None, title="Modulus")
+        e: str = Field(None, title="Exponent")
+        crv: str = Field(None, title="Curve")
+        x: str = Field(None, title="X Coordinate")
+        y: str = Field(None, title="Y Coordinate")
+        kty: t.Literal["RSA", "EC", "OKP"] = Field(title="Key Type")
         kid: str = Field(title="Key ID")
+        alg: t.Literal["RS256", "ES256", "EdDSA"] = Field(title="Algorithm")
         use: t.Literal["sig"] = Field(title="Public Key Use")
 
     keys: list[JWK]
@@ -49,6 +75,7 @@ class DiscoveryResponse(BaseModel, title="OpenID Connect Discovery"):
     authorization_endpoint: HttpUrl
     token_endpoint: HttpUrl
     userinfo_endpoint: HttpUrl = Field(title="User Info Endpoint")
+    introspection_endpoint: HttpUrl
     jwks_uri: HttpUrl = Field(title="JWKS URI")
     claims_supported: list[str]
     grant_types_supported: list[str]
@@ -57,6 +84,7 @@ class DiscoveryResponse(BaseModel, title="OpenID Connect Discovery"):
     )
     token_endpoint_auth_methods_supported: list[str]
     response_types_supported: list[str]
+    subject_types_supported: list[str]
     scopes_supported: list[str]
 
 
@@ -1,74 +1,488 @@
+import asyncio
+import hashlib
+import itertools
 import json
 import time
-from json import JSONDecodeError
+import typing as t
+from functools import lru_cache
 from pathlib import Path
 
+import orjson
+
 # noinspection PyUnresolvedReferences
 from authlib.integrations.starlette_client import StarletteOAuth2App
-from joserfc import jwt
-from joserfc.errors import JoseError
-from joserfc.jwk import KeySet
+from joserfc import jwe, jwt
+from joserfc.errors import DecodeError, InvalidTokenError, JoseError
+from joserfc.jwk import GuestProtocol, Key, KeySet, OctKey
 from joserfc.jwt import Token
 
-from snowflake import utils
+from snowflake import executor, keys, metrics, tracing, utils
+from snowflake.cache import TTLCache
 from snowflake.settings import settings
 
-PRIVATE_KEY_FILE = Path(__file__).parent / "data" / "keys" / "jwt_private_key.json"
+# How often, in seconds, the private key file is checked for changes.
+PRIVATE_KEY_CHECK_INTERVAL = 1
+
+# The maximum number of refresh_token grant results kept for replay.
+REFRESH_REPLAY_CACHE_SIZE = 10000
+
+# The maximum number of access tokens verified in a single job on the crypto executor.
+VERIFICATION_CHUNK_SIZE = 25
+
+
+class _PublicKeys(t.NamedTuple):
+    private_key: KeySet
+    jwks: KeySet
+    by_kid: dict[str, Key]
+    document: bytes
+    etag: str
+
+
+_public_keys: _PublicKeys | None = None
+_internal_key: OctKey | None = None
 
 
 def create_private_key() -> None:
     """
-    Create a new private key.
+    Create a new private key for the configured signing algorithm and make it the active signing key.
+
+    Nothing is done if the key file already has an active key for the configured signing algorithm. Any existing
+    keys are kept for verification.
     """
-    key = KeySet.generate_key_set(
-        "RSA", 2048, parameters={"use": "sig", "alg": "RS256"}, private=True, count=1
-    )
+    algorithm = settings().signing_algorithm
+
+    with keys.key_file_lock():
+        try:
+            data = json.loads(keys.PRIVATE_KEY_FILE.read_text())
+            active_key = keys.import_key_ring(data).keys[0]
+            stored_keys = keys.import_key_list(data)
+        except (FileNotFoundError, ValueError, KeyError, JoseError):
+            active_key, stored_keys = None, []
+
+        if active_key and active_key.alg == algorithm:
+            return
 
-    PRIVATE_KEY_FILE.parent.mkdir(parents=True, exist_ok=True)
-    json.dump(key.as_dict(private=True), PRIVATE_KEY_FILE.open("w"))
+        # The new key is the newest, so it goes first; the order of the others is kept as-is for `rotate-key retire`.
+        key = keys.generate_key(algorithm)
+        keys.write_key_file(keys.export_key_ring([key, *stored_keys], key))
+
+
+def _read_private_key(path: Path) -> KeySet:
+    """
+    Read the private key ring from the private key file, creating a new active key first if the active key isn't
+    for the configured signing algorithm.
+    """
+    key = keys.import_key_ring(json.loads(path.read_text()))
+
+    if key.keys[0].alg != settings().signing_algorithm:
+        create_private_key()
+        key = keys.import_key_ring(json.loads(path.read_text()))
+
+    return key
+
+
+_private_key_file = utils.ReloadingFile(
+    _read_private_key,
+    description="private key",
+    errors=(OSError, ValueError, KeyError, JoseError),
+    create=create_private_key,
+    check_interval=PRIVATE_KEY_CHECK_INTERVAL,
+)
 
 
 def get_private_key() -> KeySet:
     """
-    Get the private key, creating one if necessary.
+    Get the private key ring, creating one if necessary. The active signing key is always the first key in the set.
+
+    The key ring is cached in memory and is only reloaded when the key file changes.
     """
     if settings().private_key:
         return settings().private_key
 
-    try:
-        return KeySet.import_key_set(json.load(PRIVATE_KEY_FILE.open()))
-    except (FileNotFoundError, JSONDecodeError, JoseError):
-        pass
+    return _private_key_file.get(keys.PRIVATE_KEY_FILE)
 
-    create_private_key()
 
-    return get_private_key()
+def reload_private_key() -> None:
+    """
+    Discard the cached private key so that it is reloaded on next use.
+    """
+    _private_key_file.reload()
+
+
+def get_signing_key() -> Key:
+    """
+    Get the active signing key.
+    """
+    return get_private_key().keys[0]
 
 
 def create_jwt(claims: dict) -> str:
     """
     Create a JWT.
     """
-    return jwt.encode({"alg": "RS256"}, claims, get_private_key())
+    key = get_signing_key()
+
+    with metrics.track_jwt("sign"), tracing.span("jwt.sign", algorithm=key.alg):
+        return jwt.encode(
+            {"alg": key.alg, "kid": key.kid},
+            claims,
+            key,
+            algorithms=keys.SIGNING_ALGORITHMS,
+        )
+
+
+def _get_verification_key(obj: GuestProtocol) -> Key:
+    """
+    Look up the public key matching a JWT's `kid` header.
+    """
+    public_keys = _load_public_keys()
+    kid = obj.headers().get("kid")
+
+    if kid is None and len(public_keys.jwks.keys) == 1:
+        return public_keys.jwks.keys[0]
+
+    try:
+        return public_keys.by_kid[kid]
+    except KeyError:
+        raise DecodeError(f'No key for kid "{kid}"')
 
 
 def decode_jwt(token: str, **claims: dict) -> Token:
     """
     Decode a JWT.
     """
-    decoded = jwt.decode(token, get_jwks())
-    jwt.JWTClaimsRegistry(**claims).validate(decoded.claims)
+    with metrics.track_jwt("verify"), tracing.span("jwt.verify"):
+        decoded = jwt.decode(
+            token, _get_verification_key, algorithms=keys.SIGNING_ALGORITHMS
+        )
+        jwt.JWTClaimsRegistry(**claims).validate(decoded.claims)
 
     return decoded
 
 
+def get_internal_key() -> OctKey:
+    """
+    Get the symmetric key for tokens that only Snowflake reads, creating one if necessary.
+    """
+    global _internal_key
+
+    if settings().internal_key:
+        return settings().internal_key
+
+    if not _internal_key:
+        with keys.key_file_lock():
+            try:
+                key = keys.import_internal_key(
+                    json.loads(keys.INTERNAL_KEY_FILE.read_text())
+                )
+            except (FileNotFoundError, ValueError, KeyError, JoseError):
+                key = keys.generate_internal_key()
+                keys.write_key_file(key.as_dict(private=True), keys.INTERNAL_KEY_FILE)
+
+        _internal_key = key
+
+    return _internal_key
+
+
+def load_keys() -> None:
+    """
+    Create and load every key Snowflake needs, so that requests never have to.
+    """
+    _load_public_keys()
+
+    if settings().internal_token_protection != "sign":
+        get_internal_key()
+
+
+def create_internal_token(claims: dict) -> str:
+    """
+    Create a token that only Snowflake reads, protected as per `SNOWFLAKE_INTERNAL_TOKEN_PROTECTION`.
+    """
+    match settings().internal_token_protection:
+        case "hmac":
+            return jwt.encode(
+                {"alg": "HS256"}, claims, get_internal_key(), algorithms=["HS256"]
+            )
+        case "encrypt":
+            return jwt.encode(
+                {"alg": "dir", "enc": "A256GCM"},
+                claims,
+                get_internal_key(),
+                algorithms=["dir", "A256GCM"],
+                registry=jwe.JWERegistry(),
+            )
+
+    return create_jwt(claims)
+
+
+def decode_internal_token(token: str) -> dict:
+    """
+    Decode a token created by `create_internal_token` and return its claims.
+    """
+    match settings().internal_token_protection:
+        case "hmac":
+            decoded = jwt.decode(token, get_internal_key(), algorithms=["HS256"])
+        case "encrypt":
+            decoded = jwt.decode(
+                token,
+                get_internal_key(),
+                algorithms=["dir", "A256GCM"],
+                registry=jwe.JWERegistry(),
+            )
+        case _:
+            return decode_jwt(token).claims
+
+    jwt.JWTClaimsRegistry().validate(decoded.claims)
+
+    return decoded.claims
+
+
+def _load_public_keys() -> _PublicKeys:
+    """
+    Get the public JSON Web Key Set along with a key ID index, its serialized form, and its ETag, rebuilding them
+    if the private key has changed.
+    """
+    global _public_keys
+
+    private_key = get_private_key()
+
+    if not _public_keys or _public_keys.private_key is not private_key:
+        jwks = KeySet.import_key_set(
+            private_key.as_dict(private=False), parameters={"use": "sig"}
+        )
+        document = orjson.dumps(jwks.as_dict())
+
+        _public_keys = _PublicKeys(
+            private_key=private_key,
+            jwks=jwks,
+            by_kid={key.kid: key for key in jwks.keys},
+            document=document,
+            etag=f'"{hashlib.sha256(document).hexdigest()}"',
+        )
+
+        # Tokens verified with the old key ring may not verify with the new one.
+        verified_token_cache().clear()
+
+    return _public_keys
+
+
 def get_jwks() -> KeySet:
     """
     Get the public JSON Web Key Set.
     """
-    return KeySet.import_key_set(
-        get_private_key().as_dict(private=False), parameters={"use": "sig"}
-    )
+    return _load_public_keys().jwks
+
+
+def get_jwks_document() -> tuple[bytes, str]:
+    """
+    Get the serialized public JSON Web Key Set and its ETag.
+    """
+    public_keys = _load_public_keys()
+
+    return public_keys.document, public_keys.etag
+
+
+async def _get_guild_ids(discord: StarletteOAuth2App, discord_token: dict) -> list[str]:
+    """
+    Get the IDs of the guilds a Discord user is a member of.
+    """
+    with (
+        metrics.track_discord_request("guilds"),
+        tracing.span("discord.guilds"),
+    ):
+        guilds = (
+            (await discord.get("users/@me/guilds", token=discord_token))
+            .raise_for_status()
+            .json()
+        )
+
+    return [guild["id"] for guild in guilds]
+
+
+async def _get_userinfo(discord: StarletteOAuth2App, discord_token: dict) -> dict:
+    """
+    Get a Discord user's OpenID Connect claims.
+    """
+    with (
+        metrics.track_discord_request("userinfo"),
+        tracing.span("discord.userinfo"),
+    ):
+        return dict(await discord.userinfo(token=discord_token))
+
+
+@lru_cache
+def claims_cache() -> TTLCache[tuple[str, str], t.Any]:
+    """
+    Get the cache of Discord user claims and guild IDs.
+
+    Entries are keyed by Discord user ID. Hashes of the refresh tokens Snowflake has handed out are mapped to the
+    user IDs they belong to, so that `refresh_token` grants can be served from the cache.
+    """
+    return TTLCache(settings().claims_cache_size, settings().claims_cache_lifetime)
+
+
+def invalidate_claims(user_id: str) -> None:
+    """
+    Remove a Discord user's claims and guild IDs from the cache.
+    """
+    claims_cache().pop(("claims", user_id))
+    claims_cache().pop(("guilds", user_id))
+
+
+def invalidate_refresh_token(refresh_token: str) -> None:
+    """
+    Forget a refresh token Discord has rejected, along with the cached claims and guild IDs of the user it belonged
+    to, who may have revoked Snowflake's access or changed their account since.
+    """
+    cache = claims_cache()
+    key = ("user", _hash_token(refresh_token))
+
+    if user_id := cache.get(key):
+        cache.pop(key)
+        invalidate_claims(user_id)
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+@lru_cache
+def verified_token_cache() -> TTLCache[tuple[str, str, str], dict]:
+    """
+    Get the cache of verified access token claims.
+
+    Entries are keyed by a hash of the token along with the expected issuer and audience, and expire when the token
+    does.
+    """
+    return TTLCache(settings().verified_token_cache_size, settings().token_lifetime)
+
+
+@lru_cache
+def refresh_replay_cache() -> TTLCache[str, dict]:
+    """
+    Get the cache of recent `refresh_token` grant results.
+
+    Entries are keyed by a hash of the form the grant sent to Discord and the issuer, and expire after
+    `SNOWFLAKE_REFRESH_GRACE_PERIOD`.
+    """
+    return TTLCache(REFRESH_REPLAY_CACHE_SIZE, settings().refresh_grace_period)
+
+
+_refreshes: dict[str, asyncio.Task[dict]] = {}
+
+
+async def refresh_once(
+    refresh: t.Callable[[], t.Awaitable[dict]],
+    *,
+    grant: dict[str, str | None],
+    issuer: str,
+) -> dict:
+    """
+    Fulfill a `refresh_token` grant by awaiting `refresh`, unless an identical grant is already in progress or was
+    fulfilled within `SNOWFLAKE_REFRESH_GRACE_PERIOD`, in which case its result is shared instead.
+
+    Grants are identical if they're for the same issuer and `grant`, the form sent to Discord, is the same. Discord
+    rotates refresh tokens, so only the first of several concurrent grants with the same refresh token would
+    otherwise succeed.
+    """
+    key = hashlib.sha256(
+        orjson.dumps([issuer, sorted(grant.items())], default=str)
+    ).hexdigest()
+
+    if tokens := refresh_replay_cache().get(key):
+        return tokens
+
+    if not (task := _refreshes.get(key)):
+        task = _refreshes[key] = asyncio.create_task(refresh())
+
+        def finish(task: asyncio.Task[dict]) -> None:
+            del _refreshes[key]
+
+            if not task.cancelled() and not task.exception():
+                refresh_replay_cache().set(key, task.result())
+
+        task.add_done_callback(finish)
+
+    # Shielding the grant keeps one client giving up from cancelling it for everyone else.
+    return await asyncio.shield(task)
+
+
+def _decode_access_tokens(
+    tokens: list[str], *, issuer: str, audience: str
+) -> list[dict | None]:
+    """
+    Decode several access tokens, returning `None` in place of the claims of any that are invalid.
+    """
+    results = []
+
+    for token in tokens:
+        try:
+            decoded = decode_jwt(
+                token,
+                iss={"essential": True, "value": issuer},
+                aud={"essential": True, "value": audience},
+                exp={"essential": True},
+            )
+        except (JoseError, ValueError):
+            results.append(None)
+        else:
+            results.append(decoded.claims)
+
+    return results
+
+
+async def verify_access_tokens(
+    tokens: list[str], *, issuer: str, audience: str
+) -> list[dict | None]:
+    """
+    Verify several access tokens and return their claims, or `None` in place of the claims of any that are invalid.
+
+    Claims are cached until the token expires, so verifying the same token again doesn't repeat the signature check.
+    Tokens that aren't cached are verified in jobs of up to `VERIFICATION_CHUNK_SIZE` tokens on the crypto executor,
+    each of which counts towards `SNOWFLAKE_CRYPTO_MAX_BACKLOG`.
+    """
+    # This discards cached claims if the key ring has changed.
+    _load_public_keys()
+
+    cache = verified_token_cache()
+    cache_keys = [(_hash_token(token), issuer, audience) for token in tokens]
+    results = [cache.get(cache_key) for cache_key in cache_keys]
+    misses = [i for i, claims in enumerate(results) if claims is None]
+
+    if misses:
+        decoded = await asyncio.gather(
+            *(
+                executor.run(
+                    _decode_access_tokens,
+                    [
+                        tokens[i]
+                        for i in misses[start : start + VERIFICATION_CHUNK_SIZE]
+                    ],
+                    issuer=issuer,
+                    audience=audience,
+                )
+                for start in range(0, len(misses), VERIFICATION_CHUNK_SIZE)
+            )
+        )
+
+        for i, claims in zip(misses, itertools.chain.from_iterable(decoded)):
+            if claims:
+                cache.set(cache_keys[i], claims, ttl=claims["exp"] - time.time())
+                results[i] = claims
+
+    return results
+
+
+async def verify_access_token(token: str, *, issuer: str, audience: str) -> dict:
+    """
+    Verify an access token and return its claims.
+    """
+    (claims,) = await verify_access_tokens([token], issuer=issuer, audience=audience)
+
+    if claims is None:
+        raise InvalidTokenError()
+
+    return claims
 
 
 async def create_tokens(
@@ -78,39 +492,82 @@ async def create_tokens(
     oidc_metadata: dict,
     nonce: str | None = None,
     include_refresh_token: bool = True,
+    refresh_token: str | None = None,
+    token_lifetime: int | None = None,
 ) -> dict[str, str | int]:
     """
-    Create a pair of access and ID tokens.
+    Create a pair of access and ID tokens that expire after `token_lifetime` seconds, or `SNOWFLAKE_TOKEN_LIFETIME`
+    if it isn't given.
+
+    If `discord_token` was obtained with a refresh token, pass that refresh token as `refresh_token` so that cached
+    claims can be used.
     """
-    access_claims = await discord.userinfo(token=discord_token)
+    scopes = utils.convert_scopes(
+        discord_token["scope"], to_format="openid", output_type=list
+    )
+
+    cache = claims_cache()
+    cached_claims = cached_guild_ids = None
+
+    if refresh_token and (user_id := cache.get(("user", _hash_token(refresh_token)))):
+        cached_scope, cached_claims = cache.get(("claims", user_id), (None, None))
+
+        if cached_scope != discord_token["scope"]:
+            cached_claims = None
+
+        if "groups" in scopes:
+            cached_guild_ids = cache.get(("guilds", user_id))
+
+    # Whatever isn't cached is fetched from Discord concurrently. If either request fails, the other is cancelled
+    # and the failure is raised as-is.
+    try:
+        async with asyncio.TaskGroup() as task_group:
+            if not cached_claims:
+                userinfo_task = task_group.create_task(
+                    _get_userinfo(discord, discord_token)
+                )
+
+            if "groups" in scopes and cached_guild_ids is None:
+                guilds_task = task_group.create_task(
+                    _get_guild_ids(discord, discord_token)
+                )
+    except ExceptionGroup as e:
+        raise e.exceptions[0]
+
+    if not cached_claims:
+        cached_claims = userinfo_task.result()
+        cache.set(
+            ("claims", cached_claims["sub"]), (discord_token["scope"], cached_claims)
+        )
+
+    access_claims = dict(cached_claims)
+    user_id = access_claims["sub"]
+
+    if "refresh_token" in discord_token:
+        cache.set(("user", _hash_token(discord_token["refresh_token"])), user_id)
 
     now = int(time.time())
-    expiry = now + settings().token_lifetime
+    expiry = now + (token_lifetime or settings().token_lifetime)
 
     access_claims.update(
         {
             "iss": oidc_metadata["issuer"],
             "aud": oidc_metadata["userinfo_endpoint"],
+            "azp": discord.client_id,
             "iat": now,
             "exp": expiry,
         }
     )
 
-    scopes = utils.convert_scopes(
-        discord_token["scope"], to_format="openid", output_type=list
-    )
-
     if "profile" in scopes:
         access_claims["name"] = access_claims["nickname"]
 
     if "groups" in scopes:
-        guilds = (
-            (await discord.get("users/@me/guilds", token=discord_token))
-            .raise_for_status()
-            .json()
-        )
+        if cached_guild_ids is None:
+            cached_guild_ids = guilds_task.result()
+            cache.set(("guilds", user_id), cached_guild_ids)
 
-        access_claims["groups"] = [guild["id"] for guild in guilds]
+        access_claims["groups"] = list(cached_guild_ids)
 
     identity_claims = {
         **access_claims,
@@ -120,8 +577,11 @@ async def create_tokens(
     if nonce is not None:
         identity_claims["nonce"] = nonce
 
-    access_token = create_jwt(access_claims)
-    identity_token = create_jwt(identity_claims)
+    # Both tokens are signed in parallel, off the event loop.
+    access_token, identity_token = await asyncio.gather(
+        executor.run(create_jwt, access_claims),
+        executor.run(create_jwt, identity_claims),
+    )
 
     tokens = {
         "access_token": access_token,
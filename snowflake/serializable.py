@@ -5,7 +5,7 @@ import typing as t
 from authlib.oauth2.rfc6749 import MismatchingStateException
 from fastapi.exceptions import HTTPException
 from joserfc.errors import JoseError
-from pydantic import BaseModel, ValidationError, computed_field
+from pydantic import BaseModel, computed_field
 
 from snowflake import security
 
@@ -30,15 +30,15 @@ class Serializable(BaseModel):
         """
         Serialize this model to a JWT.
         """
-        return security.create_jwt(self.model_dump())
+        return security.create_internal_token(self.model_dump())
 
     @classmethod
     def from_jwt(cls, token: str) -> t.Self:
         """
         Deserialize this model from a JWT.
         """
-        decoded = security.decode_jwt(token)
-        return cls.model_validate(decoded.claims)
+        claims = security.decode_internal_token(token)
+        return cls.model_validate(claims)
 
 
 class SnowflakeStateData(Serializable):
@@ -51,7 +51,7 @@ class SnowflakeStateData(Serializable):
     def from_jwt(cls, token: str) -> t.Self:
         try:
             return super(SnowflakeStateData, cls).from_jwt(token)
-        except (JoseError, ValidationError):
+        except (JoseError, ValueError):
             raise MismatchingStateException()
 
 
@@ -63,5 +63,5 @@ class SnowflakeAuthorizationData(Serializable):
     def from_jwt(cls, token: str) -> t.Self:
         try:
             return super(SnowflakeAuthorizationData, cls).from_jwt(token)
-        except (JoseError, ValidationError):
+        except (JoseError, ValueError):
             raise HTTPException(400, "Invalid authorization code")
@@ -3,15 +3,15 @@ import logging
 import typing as t
 from functools import lru_cache
 
-import dns.name
 import durationpy
-from joserfc.jwk import KeySet
-from joserfc.rfc7518.rsa_key import RSAKey
+from joserfc.jwk import KeySet, OctKey
 from pydantic import (
     BaseModel,
     BeforeValidator,
     Field,
+    FilePath,
     field_validator,
+    model_validator,
 )
 from pydantic_core.core_schema import ValidationInfo
 from pydantic_settings import (
@@ -20,13 +20,25 @@ from pydantic_settings import (
     SettingsConfigDict,
 )
 
-Duration = t.Annotated[
-    int, BeforeValidator(lambda v: durationpy.from_str(v).total_seconds())
-]
+from snowflake import keys
+
+
+def _parse_duration(v: t.Any) -> t.Any:
+    """
+    Convert a Go duration string to a number of seconds. Numbers are taken to be seconds already.
+    """
+    if isinstance(v, str):
+        return durationpy.from_str(v).total_seconds()
+
+    return v
+
+
+Duration = t.Annotated[int, BeforeValidator(_parse_duration)]
 
 
 class SnowflakePrivateSettings(BaseModel):
     show_scalar_devtools_on_localhost: bool = False
+    discord_url: str = "https://discord.com"
 
 
 class SnowflakeSettings(BaseSettings):
@@ -38,17 +50,44 @@ class SnowflakeSettings(BaseSettings):
     allowed_clients: t.Annotated[list[str], NoDecode] = Field(
         default=["*"], validate_default=False
     )
+    clients_file: FilePath | None = None
     base_path: str = "/"
     fix_redirect_uris: bool = False
     token_lifetime: Duration = Field("1h", ge=60)
     root_redirect: t.Literal["repo", "settings", "docs", "off"] = "repo"
     treat_loopback_as_secure: bool = True
     return_to_referrer: bool = False
-    allowed_webfinger_hosts: t.Annotated[list[dns.name.Name], NoDecode] = Field(
+    allowed_webfinger_hosts: t.Annotated[list[str], NoDecode] = Field(
         default_factory=list, validate_default=False
     )
     private_key: t.Annotated[KeySet, NoDecode] = Field(None, validate_default=False)
+    signing_algorithm: keys.SigningAlgorithm = "RS256"
+    internal_token_protection: t.Literal["sign", "hmac", "encrypt"] = "sign"
+    internal_key: t.Annotated[OctKey, NoDecode] = Field(None, validate_default=False)
+    crypto_executor: t.Literal["thread", "process", "inline"] = "thread"
+    crypto_workers: int | None = Field(None, ge=1)
+    crypto_max_backlog: int = Field(1000, ge=1)
+    workers: int | None = Field(None, ge=1)
+    discord_http2: bool = False
+    discord_max_connections: int = Field(100, ge=1)
+    discord_max_keepalive_connections: int = Field(20, ge=0)
+    discord_keepalive_expiry: Duration = Field("30s", ge=0)
+    discord_timeout: Duration = Field("10s", ge=1)
+    discord_metadata_lifetime: Duration = Field("1h", ge=0)
+    discord_max_retries: int = Field(3, ge=0)
+    discord_max_rate_limit_wait: Duration = Field("10s", ge=0)
+    claims_cache_size: int = Field(10000, ge=0)
+    claims_cache_lifetime: Duration = Field("5m", ge=0)
+    verified_token_cache_size: int = Field(10000, ge=0)
+    refresh_grace_period: Duration = Field("10s", ge=0)
     enable_docs: bool = False
+    enable_metrics: bool = False
+    tracing_exporter: t.Literal["none", "otlp", "console", "file"] = "none"
+    tracing_otlp_endpoint: str | None = None
+    tracing_file: str = "snowflake-traces.jsonl"
+    jwks_cache_lifetime: Duration = Field("5m", ge=0)
+    discovery_cache_lifetime: Duration = Field("1h", ge=0)
+    webfinger_cache_lifetime: Duration = Field("1h", ge=0)
 
     private: SnowflakePrivateSettings = Field(default_factory=SnowflakePrivateSettings)
 
@@ -71,7 +110,9 @@ class SnowflakeSettings(BaseSettings):
 
     @field_validator("allowed_webfinger_hosts", mode="before")
     @classmethod
-    def validate_allowed_webfinger_hosts(cls, v: str) -> list[dns.name.Name]:
+    def validate_allowed_webfinger_hosts(cls, v: str) -> list[str]:
+        import dns.name
+
         hosts = []
 
         for i in v.split(","):
@@ -82,7 +123,7 @@ class SnowflakeSettings(BaseSettings):
                     "The unqualified wildcard ('*') is not permitted in SNOWFLAKE_ALLOWED_WEBFINGER_HOSTS"
                 )
 
-            hosts.append(name)
+            hosts.append(name.to_text())
 
         return hosts
 
@@ -96,22 +137,58 @@ class SnowflakeSettings(BaseSettings):
     def validate_private_key(cls, v: str) -> KeySet:
         variable_name = "SNOWFLAKE_PRIVATE_KEY"
 
-        key = RSAKey.import_key(json.loads(v))
+        key_ring = keys.import_key_ring(json.loads(v))
 
-        if not key.is_private:
-            raise ValueError(f"{variable_name} must be a private key")
+        for key in key_ring.keys:
+            if not key.is_private:
+                raise ValueError(f"{variable_name} must only contain private keys")
 
-        if key.alg != "RS256":
-            raise ValueError(f"{variable_name} must be an RS256 key")
+            if key.alg not in keys.SIGNING_ALGORITHMS:
+                raise ValueError(
+                    f"{variable_name} must only contain keys for one of these algorithms: "
+                    + ", ".join(keys.SIGNING_ALGORITHMS)
+                )
 
         logging.getLogger("uvicorn").info("Snowflake is using a custom private key.")
 
-        return KeySet([key])
+        return key_ring
+
+    @field_validator("internal_key", mode="before")
+    @classmethod
+    def validate_internal_key(cls, v: str) -> OctKey:
+        try:
+            key = keys.import_internal_key(json.loads(v))
+        except ValueError:
+            raise ValueError(
+                "SNOWFLAKE_INTERNAL_KEY must be a 256-bit symmetric JSON Web Key"
+            )
+
+        logging.getLogger("uvicorn").info("Snowflake is using a custom internal key.")
+
+        return key
+
+    @model_validator(mode="after")
+    def validate_signing_algorithm(self) -> t.Self:
+        if not self.private_key:
+            return self
+
+        key_algorithm = self.private_key.keys[0].alg
+
+        # The custom private key's algorithm is only used if SNOWFLAKE_SIGNING_ALGORITHM isn't set.
+        if (
+            "signing_algorithm" in self.model_fields_set
+            and self.signing_algorithm != key_algorithm
+        ):
+            raise ValueError(
+                f"SNOWFLAKE_SIGNING_ALGORITHM is {self.signing_algorithm}, but the active key in "
+                f"SNOWFLAKE_PRIVATE_KEY is for {key_algorithm}"
+            )
+
+        self.signing_algorithm = key_algorithm
+
+        return self
 
 
 @lru_cache
 def settings() -> SnowflakeSettings:
     return SnowflakeSettings()
-
-
-settings()
@@ -0,0 +1,168 @@
+import os
+import typing as t
+from contextlib import nullcontext
+
+import httpx
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from snowflake.settings import settings
+
+if t.TYPE_CHECKING:
+    from opentelemetry.trace import Span, Tracer
+
+_tracer: "Tracer | None" = None
+
+
+def configure() -> None:
+    """
+    Set up OpenTelemetry tracing with the exporter chosen by `SNOWFLAKE_TRACING_EXPORTER`.
+
+    OpenTelemetry is only imported here, so it need not be installed unless tracing is enabled.
+    """
+    global _tracer
+
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import (
+            BatchSpanProcessor,
+            ConsoleSpanExporter,
+        )
+    except ImportError:
+        raise RuntimeError(
+            "SNOWFLAKE_TRACING_EXPORTER requires Snowflake's tracing extra to be installed "
+            "(e.g., uv sync --extra tracing)."
+        )
+
+    match settings().tracing_exporter:
+        case "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,
+            )
+
+            exporter = OTLPSpanExporter(endpoint=settings().tracing_otlp_endpoint)
+        case "console":
+            exporter = ConsoleSpanExporter()
+        case "file":
+            exporter = ConsoleSpanExporter(
+                out=open(settings().tracing_file, "a"),
+                formatter=lambda span: span.to_json(indent=None) + "\n",
+            )
+        case _:
+            return
+
+    provider = TracerProvider(
+        resource=Resource.create(
+            {"service.name": os.getenv("OTEL_SERVICE_NAME", "snowflake")}
+        )
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    _tracer = trace.get_tracer("snowflake")
+
+
+def shutdown() -> None:
+    """
+    Export any spans that haven't been exported yet.
+    """
+    if _tracer:
+        from opentelemetry import trace
+
+        trace.get_tracer_provider().shutdown()
+
+
+def span(name: str, **attributes: t.Any) -> t.ContextManager["Span | None"]:
+    """
+    Return a context manager that records a span, or does nothing if tracing is disabled.
+    """
+    if not _tracer:
+        return nullcontext()
+
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+class TracingMiddleware:
+    """
+    Record a span for each HTTP request, continuing any trace the client propagated to Snowflake.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not _tracer:
+            return await self.app(scope, receive, send)
+
+        from opentelemetry import propagate
+        from opentelemetry.trace import SpanKind, Status, StatusCode
+
+        context = propagate.extract(
+            {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        )
+
+        with _tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            context=context,
+            kind=SpanKind.SERVER,
+            attributes={
+                "http.request.method": scope["method"],
+                "url.path": scope["path"],
+            },
+        ) as request_span:
+
+            async def send_with_status(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute(
+                        "http.response.status_code", message["status"]
+                    )
+
+                    if message["status"] >= 500:
+                        request_span.set_status(Status(StatusCode.ERROR))
+
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # Name the span after the route's path template once routing has happened.
+                if "route" in scope:
+                    request_span.update_name(f"{scope['method']} {scope['route'].path}")
+                    request_span.set_attribute("http.route", scope["route"].path)
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    A transport that records a span for each outgoing request and propagates the current trace to the server.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not _tracer:
+            return await self.transport.handle_async_request(request)
+
+        from opentelemetry import propagate
+        from opentelemetry.trace import SpanKind
+
+        with _tracer.start_as_current_span(
+            request.method,
+            kind=SpanKind.CLIENT,
+            attributes={
+                "http.request.method": request.method,
+                "server.address": request.url.host,
+                "url.path": request.url.path,
+            },
+        ) as request_span:
+            propagate.inject(request.headers)
+            response = await self.transport.handle_async_request(request)
+            request_span.set_attribute(
+                "http.response.status_code", response.status_code
+            )
+
+            return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+import typing as t
+from contextlib import asynccontextmanager
+
+import httpx
+
+from snowflake import metrics, tracing
+from snowflake.ratelimit import RateLimitedTransport
+from snowflake.settings import settings
+
+_transport: RateLimitedTransport | None = None
+_client: httpx.AsyncClient | None = None
+
+_discord_metadata: dict | None = None
+_discord_metadata_loaded_at = 0.0
+_discord_metadata_task: asyncio.Task | None = None
+
+
+def get_discord_url(path: str = "") -> str:
+    """
+    Get the URL of a path on Discord.
+    """
+    return f"{settings().private.discord_url.rstrip('/')}/{path}"
+
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """
+    A transport that forwards requests to the shared connection pool. Closing it leaves the pool open.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+def _create_transport() -> httpx.AsyncHTTPTransport:
+    """
+    Create a connection pool for requests to Discord.
+    """
+    return httpx.AsyncHTTPTransport(
+        http2=settings().discord_http2,
+        limits=httpx.Limits(
+            max_connections=settings().discord_max_connections,
+            max_keepalive_connections=settings().discord_max_keepalive_connections,
+            keepalive_expiry=settings().discord_keepalive_expiry,
+        ),
+    )
+
+
+def _open_transport() -> RateLimitedTransport:
+    """
+    Open the shared, rate-limited connection pool.
+    """
+    return RateLimitedTransport(
+        tracing.TracingTransport(_create_transport()),
+        max_retries=settings().discord_max_retries,
+        max_wait=settings().discord_max_rate_limit_wait,
+    )
+
+
+def queue_depth() -> int:
+    """
+    Return the number of requests to Discord currently waiting on a rate limit.
+    """
+    return _transport.queue_depth if _transport else 0
+
+
+def client_kwargs() -> dict[str, t.Any]:
+    """
+    Return keyword arguments that make an HTTPX client send its requests through the shared connection pool.
+    """
+    global _transport
+
+    if not _transport:
+        _transport = _open_transport()
+
+    return {
+        "transport": _SharedTransport(_transport),
+        "timeout": settings().discord_timeout,
+    }
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Get the shared HTTPX client for requests to Discord.
+    """
+    global _client
+
+    if not _client:
+        _client = httpx.AsyncClient(**client_kwargs())
+
+    return _client
+
+
+@asynccontextmanager
+async def connection_pool() -> t.AsyncIterator[None]:
+    """
+    Open the shared connection pool for requests to Discord and close it on exit.
+    """
+    global _transport, _client
+
+    _transport = _open_transport()
+
+    try:
+        yield
+    finally:
+        if _discord_metadata_task:
+            _discord_metadata_task.cancel()
+
+        transport, _transport, _client = _transport, None, None
+        await transport.aclose()
+
+
+async def _load_discord_metadata() -> dict:
+    """
+    Fetch Discord's OpenID Connect server metadata and cache it.
+    """
+    global _discord_metadata, _discord_metadata_loaded_at
+
+    with (
+        metrics.track_discord_request("metadata"),
+        tracing.span("discord.metadata"),
+    ):
+        response = await get_client().get(
+            get_discord_url(".well-known/openid-configuration")
+        )
+        _discord_metadata = response.raise_for_status().json()
+    _discord_metadata_loaded_at = time.monotonic()
+
+    return _discord_metadata
+
+
+async def _refresh_discord_metadata() -> None:
+    """
+    Refresh the cached Discord server metadata, keeping the existing copy if that fails.
+    """
+    try:
+        await _load_discord_metadata()
+    except httpx.HTTPError as e:
+        logging.getLogger("uvicorn").warning(
+            f"Could not refresh Discord's OpenID Connect server metadata: {e!r}"
+        )
+
+
+def refresh_discord_metadata() -> asyncio.Task:
+    """
+    Start refreshing the cached Discord server metadata in the background unless a refresh is already underway.
+    """
+    global _discord_metadata_task
+
+    if not _discord_metadata_task or _discord_metadata_task.done():
+        _discord_metadata_task = asyncio.create_task(_refresh_discord_metadata())
+
+    return _discord_metadata_task
+
+
+async def get_discord_metadata() -> dict:
+    """
+    Get Discord's OpenID Connect server metadata.
+
+    The metadata is cached for `SNOWFLAKE_DISCORD_METADATA_LIFETIME`. Once it's stale, it is refreshed in the
+    background and the stale copy is returned in the meantime.
+    """
+    if not _discord_metadata:
+        await refresh_discord_metadata()
+
+        # If the background refresh failed, try again in the foreground so the error reaches the caller.
+        return _discord_metadata or await _load_discord_metadata()
+
+    if (
+        time.monotonic() - _discord_metadata_loaded_at
+        > settings().discord_metadata_lifetime
+    ):
+        refresh_discord_metadata()
+
+    return _discord_metadata
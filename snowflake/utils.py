@@ -1,24 +1,84 @@
+import hashlib
+import logging
+import threading
+import time
 import typing as t
+from functools import lru_cache
+from pathlib import Path
+
+import orjson
 
 # noinspection PyUnresolvedReferences
 from authlib.integrations.starlette_client import OAuth, StarletteOAuth2App
 from authlib.oauth2.rfc6749 import list_to_scope, scope_to_list
-from fastapi import Request
-from pydantic import BeforeValidator, validate_call
+from fastapi import Request, Response
+from pydantic import BeforeValidator, validate_call, validate_email
+from starlette.applications import Starlette
 from starlette.datastructures import URL
 
+from snowflake import upstream
 from snowflake.settings import settings
 
+# Hostnames that are considered secure without HTTPS if `SNOWFLAKE_TREAT_LOOPBACK_AS_SECURE` is true.
+LOOPBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# The maximum number of Discord OAuth2 clients kept for reuse.
+OAUTH_CLIENT_CACHE_SIZE = 1024
+
+# The maximum number of base URLs to keep discovery documents for.
+DISCOVERY_CACHE_SIZE = 64
+
+# The maximum number of domains and resources to remember WebFinger lookups for.
+WEBFINGER_CACHE_SIZE = 4096
+
+T = t.TypeVar("T")
+
+_oauth = OAuth()
+
+
+class DiscoveryDocument(t.NamedTuple):
+    info: dict
+    content: bytes
+    etag: str
+
+
+class WebFingerHosts(t.NamedTuple):
+    exact: frozenset[tuple[bytes, ...]]
+    wildcard_parents: frozenset[tuple[bytes, ...]]
+
+
+class DiscordOAuth2App(StarletteOAuth2App):
+    async def load_server_metadata(self) -> dict:
+        return await upstream.get_discord_metadata()
 
-def get_oauth_client(**kwargs) -> StarletteOAuth2App:
+
+def _raise_for_token_errors(session) -> None:
+    """
+    Make an OAuth2 client raise `httpx.HTTPStatusError` for unsuccessful token responses. Discord doesn't always
+    describe failures (e.g., rate limits) with an OAuth2 error, which Authlib would otherwise raise.
+    """
+    session.register_compliance_hook(
+        "access_token_response", lambda response: response.raise_for_status()
+    )
+
+
+@lru_cache(maxsize=OAUTH_CLIENT_CACHE_SIZE)
+def get_oauth_client(
+    client_id: str, client_secret: str | None = None
+) -> StarletteOAuth2App:
     """
-    Create a client for Discord's OAuth2 API.
+    Get a client for Discord's OAuth2 API.
+
+    Clients are kept for reuse, and all of them share a single cached copy of Discord's server metadata.
     """
-    return OAuth().register(
+    return DiscordOAuth2App(
+        _oauth,
         name="discord",
-        server_metadata_url="https://discord.com/.well-known/openid-configuration",
-        api_base_url="https://discord.com/api/",
-        **kwargs,
+        client_id=client_id,
+        client_secret=client_secret,
+        api_base_url=upstream.get_discord_url("api/"),
+        client_kwargs=upstream.client_kwargs(),
+        compliance_fix=_raise_for_token_errors,
     )
 
 
@@ -65,28 +125,25 @@ def is_secure_transport(url: str | URL) -> bool:
         url = URL(url)
 
     return url.scheme == "https" or (
-        settings().treat_loopback_as_secure
-        and url.hostname in ["localhost", "127.0.0.1", "::1"]
+        settings().treat_loopback_as_secure and url.hostname in LOOPBACK_HOSTS
     )
 
 
-def client_is_allowed(client_id: int) -> bool:
+def _create_discovery_info(app: Starlette, base_url: str) -> dict:
     """
-    Return `True` if the given client ID is allowed per `SNOWFLAKE_ALLOWED_CLIENTS`; `False` otherwise.
+    Build OpenID Connect Discovery information for a base URL.
     """
-    return bool({client_id, "*"}.intersection(settings().allowed_clients))
 
+    def url_for(name: str) -> str:
+        return str(app.url_path_for(name).make_absolute_url(base_url))
 
-def get_discovery_info(request: Request) -> dict:
-    """
-    Return OpenID Connect Discovery information.
-    """
     return {
-        "issuer": str(request.base_url),
-        "authorization_endpoint": str(request.url_for("authorize")),
-        "token_endpoint": str(request.url_for("token")),
-        "userinfo_endpoint": str(request.url_for("userinfo")),
-        "jwks_uri": str(request.url_for("jwks")),
+        "issuer": base_url,
+        "authorization_endpoint": url_for("authorize"),
+        "token_endpoint": url_for("token"),
+        "userinfo_endpoint": url_for("userinfo"),
+        "introspection_endpoint": url_for("introspect"),
+        "jwks_uri": url_for("jwks"),
         "claims_supported": [
             "sub",
             "name",
@@ -98,7 +155,7 @@ def get_discovery_info(request: Request) -> dict:
             "groups",
         ],
         "grant_types_supported": ["authorization_code"],
-        "id_token_signing_alg_values_supported": ["RS256"],
+        "id_token_signing_alg_values_supported": [settings().signing_algorithm],
         "token_endpoint_auth_methods_supported": [
             "client_secret_basic",
             "client_secret_post",
@@ -107,3 +164,209 @@ def get_discovery_info(request: Request) -> dict:
         "subject_types_supported": ["public"],
         "scopes_supported": ["openid", "profile", "email", "groups"],
     }
+
+
+def get_discovery_document(request: Request) -> DiscoveryDocument:
+    """
+    Get the OpenID Connect Discovery document for the request's base URL, along with its serialized form and ETag.
+    """
+    return _get_discovery_document(request.app, str(request.base_url))
+
+
+@lru_cache(maxsize=DISCOVERY_CACHE_SIZE)
+def _get_discovery_document(app: Starlette, base_url: str) -> DiscoveryDocument:
+    """
+    Build the OpenID Connect Discovery document for a base URL. Documents are built once per base URL and reused
+    thereafter.
+    """
+    info = _create_discovery_info(app, base_url)
+    content = orjson.dumps(info)
+
+    return DiscoveryDocument(
+        info=info,
+        content=content,
+        etag=f'"{hashlib.sha256(content).hexdigest()}"',
+    )
+
+
+def get_discovery_info(request: Request) -> dict:
+    """
+    Return OpenID Connect Discovery information.
+    """
+    return get_discovery_document(request).info
+
+
+def get_userinfo_claims(claims: dict, oidc_metadata: dict) -> dict:
+    """
+    Return the claims of an access token that describe the user, omitting any that are null.
+    """
+    return {
+        k: v
+        for k, v in claims.items()
+        if k in oidc_metadata["claims_supported"] and v is not None
+    }
+
+
+@lru_cache
+def get_allowed_webfinger_hosts() -> WebFingerHosts:
+    """
+    Get the domains permitted by `SNOWFLAKE_ALLOWED_WEBFINGER_HOSTS`, indexed by their lowercased labels.
+    """
+    if not settings().allowed_webfinger_hosts:
+        return WebFingerHosts(frozenset(), frozenset())
+
+    import dns.name
+
+    exact = set()
+    wildcard_parents = set()
+
+    for host in settings().allowed_webfinger_hosts:
+        name = dns.name.from_text(host).canonicalize()
+
+        if name.is_wild():
+            wildcard_parents.add(name.parent().labels)
+        else:
+            exact.add(name.labels)
+
+    return WebFingerHosts(frozenset(exact), frozenset(wildcard_parents))
+
+
+@lru_cache(maxsize=WEBFINGER_CACHE_SIZE)
+def is_webfinger_host_allowed(domain: str) -> bool:
+    """
+    Whether `SNOWFLAKE_ALLOWED_WEBFINGER_HOSTS` permits a domain, either exactly or by a wildcard matching the domain
+    or any of its parents.
+    """
+    hosts = get_allowed_webfinger_hosts()
+
+    if not (hosts.exact or hosts.wildcard_parents):
+        return False
+
+    import dns.name
+
+    labels = dns.name.from_text(domain).canonicalize().labels
+
+    return labels in hosts.exact or any(
+        labels[i:] in hosts.wildcard_parents for i in range(len(labels))
+    )
+
+
+@lru_cache(maxsize=WEBFINGER_CACHE_SIZE)
+def normalize_webfinger_resource(resource: str) -> str:
+    """
+    Validate and normalize the email address in an `acct:` URI.
+    """
+    return "acct:" + validate_email(resource.split("acct:")[1])[1]
+
+
+def file_signature(path: Path) -> tuple[int, int, int] | None:
+    """
+    Return a value that changes whenever the file at the given path is modified or replaced, or `None` if the file
+    does not exist.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class ReloadingFile(t.Generic[T]):
+    """
+    Something loaded from a file, which is cached in memory and only reloaded when the file changes. The file is
+    checked for changes at most once every `check_interval` seconds.
+
+    If the file can't be loaded with `load` (i.e., it raises one of `errors`), the previously-loaded value continues
+    to be used. If there isn't one, `create` is called to create the file, or the error is raised if there's no
+    `create` either.
+    """
+
+    def __init__(
+        self,
+        load: t.Callable[[Path], T],
+        *,
+        description: str,
+        errors: tuple[type[Exception], ...] = (OSError, ValueError),
+        create: t.Callable[[], None] | None = None,
+        check_interval: float = 1,
+    ):
+        self.load = load
+        self.description = description
+        self.errors = errors
+        self.create = create
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._value: T | None = None
+        self._signature: tuple[int, int, int] | None = None
+        self._checked_at = 0.0
+
+    def get(self, path: Path) -> T:
+        """
+        Get the value loaded from the file at the given path, reloading it if the file has changed.
+        """
+        now = time.monotonic()
+
+        if self._value is not None and now - self._checked_at < self.check_interval:
+            return self._value
+
+        with self._lock:
+            self._checked_at = now
+            signature = file_signature(path)
+
+            if self._value is not None and signature == self._signature:
+                return self._value
+
+            try:
+                value = self.load(path)
+            except self.errors:
+                if self._value is not None:
+                    logging.getLogger("uvicorn").warning(
+                        f"{path} could not be loaded. Snowflake will continue using the previously-loaded "
+                        f"{self.description}."
+                    )
+                    self._signature = signature
+                    return self._value
+
+                if not self.create:
+                    raise
+
+                self.create()
+                signature = file_signature(path)
+                value = self.load(path)
+
+            if self._value is not None:
+                logging.getLogger("uvicorn").info(
+                    f"Reloaded the {self.description} from {path}."
+                )
+
+            # The value is replaced wholesale, so callers never see a partially-loaded one.
+            self._value, self._signature = value, signature
+
+            return value
+
+    def reload(self) -> None:
+        """
+        Make the next call to `get` reload the file, even if it hasn't changed.
+        """
+        with self._lock:
+            self._checked_at = 0.0
+            self._signature = None
+
+
+def cached_json_response(
+    request: Request, content: bytes, *, etag: str, max_age: int
+) -> Response:
+    """
+    Return a cacheable response for pre-serialized JSON, or an HTTP 304 response if the client already has it.
+    """
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if_none_match = request.headers.get("if-none-match", "")
+
+    if if_none_match.strip() == "*" or etag in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content, media_type="application/json", headers=headers)